@@ -0,0 +1,355 @@
+"""Local stand-ins for the GitHub, GitLab and Azure DevOps REST endpoints the service calls.
+
+All three platforms are served from one threaded HTTP server under a path prefix each:
+
+    GITHUB_API_URL   = <base>/github
+    GITLAB_API_URL   = <base>/gitlab/api/v4
+    AZURE_DEVOPS_URL = <base>/azure
+
+Every response is delayed by a configurable latency, and each platform enforces its own
+fixed-window rate limit with the headers the real services send. Creating a repository
+initialises a bare git repository on disk and returns its file:// URL, so migrations can
+push to it.
+
+Run standalone with: python bench/fake_platforms.py --port 8081 --latency 0.05
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+
+class RateLimitWindow:
+    # Fixed window per platform, like GitHub's hourly and GitLab's per-minute limits
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.reset_at = time.time() + window
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        # Returns (allowed, remaining, reset_at)
+        with self.lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.reset_at = now + self.window
+                self.used = 0
+            if self.limit and self.used >= self.limit:
+                return False, 0, self.reset_at
+            self.used += 1
+            remaining = self.limit - self.used if self.limit else 1000000
+            return True, remaining, self.reset_at
+
+
+class Catalogue:
+    def __init__(self, github_repos=500, gitlab_fanout=3, gitlab_depth=2, gitlab_projects=20,
+                 azure_projects=5, azure_repos=20, repo_root=None):
+        self.github_repos = github_repos
+        self.azure_projects = azure_projects
+        self.azure_repos = azure_repos
+        self.gitlab_projects = gitlab_projects
+        self.repo_root = repo_root
+        self.created = {}
+        self.lock = threading.Lock()
+
+        # GitLab group tree: group 1 is the root, ids are handed out breadth first
+        self.subgroups = {1: []}
+        level, next_id = [1], 2
+        for _ in range(gitlab_depth):
+            next_level = []
+            for parent in level:
+                for _ in range(gitlab_fanout):
+                    self.subgroups[parent].append(next_id)
+                    self.subgroups[next_id] = []
+                    next_level.append(next_id)
+                    next_id += 1
+            level = next_level
+
+    def github_repo(self, organization, number):
+        name = f"service-{number:05d}"
+        return {
+            "id": number, "name": name, "full_name": f"{organization}/{name}",
+            "description": f"Benchmark repository {number} ({random.choice(['api', 'web', 'data', 'infra'])})",
+            "created_at": "2020-01-01T00:00:00Z", "updated_at": "2024-01-01T00:00:00Z",
+            "pushed_at": "2024-01-01T00:00:00Z",
+            "default_branch": "main", "html_url": f"https://github.example/{organization}/{name}",
+            "ssh_url": f"git@github.example:{organization}/{name}.git",
+            "clone_url": f"https://github.example/{organization}/{name}.git",
+        }
+
+    def gitlab_project(self, group, number):
+        project_id = group * 100000 + number
+        name = f"project-{project_id}"
+        return {
+            "id": project_id, "name": name, "path": name, "path_with_namespace": f"group-{group}/{name}",
+            "description": f"Benchmark project {number} of group {group}",
+            "created_at": "2020-01-01T00:00:00Z", "last_activity_at": "2024-01-01T00:00:00Z",
+            "default_branch": "main", "web_url": f"https://gitlab.example/group-{group}/{name}",
+            "ssh_url_to_repo": f"git@gitlab.example:group-{group}/{name}.git",
+            "http_url_to_repo": f"https://gitlab.example/group-{group}/{name}.git",
+        }
+
+    def azure_repo(self, organization, project, number):
+        name = f"{project}-repo-{number:04d}"
+        return {
+            "id": f"{project}-{number}", "name": name,
+            "project": {"id": project, "name": project, "description": f"Benchmark project {project}"},
+            "defaultBranch": "refs/heads/main",
+            "webUrl": f"https://azure.example/{organization}/{project}/_git/{name}",
+            "remoteUrl": f"https://azure.example/{organization}/{project}/_git/{name}",
+            "sshUrl": f"git@azure.example:v3/{organization}/{project}/{name}",
+        }
+
+    def create(self, platform, name):
+        # New repositories are real bare repositories so the migration can push into them
+        key = (platform, name)
+        with self.lock:
+            if key not in self.created:
+                path = os.path.join(self.repo_root, platform, f"{name}.git")
+                if not os.path.isdir(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    subprocess.run(["git", "init", "--quiet", "--bare", path], check=True)
+                self.created[key] = f"file://{path}"
+            return self.created[key]
+
+    def find(self, platform, name):
+        with self.lock:
+            return self.created.get((platform, name))
+
+
+class FakePlatformHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(raw or b"{}")
+        return dict(parse_qsl(raw.decode()))
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        parts = urlsplit(self.path)
+        segments = [segment for segment in parts.path.split("/") if segment]
+        query = dict(parse_qsl(parts.query))
+        platform = segments[0] if segments else ""
+        if platform not in ("github", "gitlab", "azure"):
+            return self.send_json({"message": "Not Found"}, 404)
+
+        if self.server.latency:
+            time.sleep(self.server.latency * random.uniform(1 - self.server.jitter, 1 + self.server.jitter))
+
+        allowed, remaining, reset_at = self.server.windows[platform].take()
+        headers = self.rate_limit_headers(platform, remaining, reset_at)
+        if not allowed:
+            headers["Retry-After"] = str(max(int(reset_at - time.time()) + 1, 1))
+            return self.send_json({"message": "API rate limit exceeded"}, 429, headers)
+
+        handler = getattr(self, f"{platform}_{method.lower()}")
+        handler(segments[1:], query, headers)
+
+    def rate_limit_headers(self, platform, remaining, reset_at):
+        if platform == "gitlab":
+            return {"RateLimit-Remaining": str(remaining), "RateLimit-Reset": str(int(reset_at))}
+        return {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(int(reset_at))}
+
+    def link_header(self, path, query, page, last):
+        links = []
+        for rel, number in (("next", page + 1), ("last", last)):
+            if rel == "next" and page >= last:
+                continue
+            if rel == "last" and not self.server.last_links:
+                continue
+            links.append(f'<{self.base}{path}?{urlencode({**query, "page": number})}>; rel="{rel}"')
+        return ", ".join(links)
+
+    # GitHub: /orgs/{org}/repos, /repos/{org}/{name}, POST /orgs/{org}/repos and /user/repos
+    def github_get(self, segments, query, headers):
+        catalogue = self.server.catalogue
+        if len(segments) == 3 and segments[0] == "orgs" and segments[2] == "repos":
+            per_page = int(query.get("per_page", 30))
+            page = int(query.get("page", 1))
+            last = max((catalogue.github_repos + per_page - 1) // per_page, 1)
+            start = (page - 1) * per_page
+            repos = [catalogue.github_repo(segments[1], number)
+                     for number in range(start + 1, min(start + per_page, catalogue.github_repos) + 1)]
+            headers["Link"] = self.link_header(f"/github/orgs/{segments[1]}/repos", query, page, last)
+            return self.send_json(repos, headers=headers)
+        if len(segments) == 3 and segments[0] == "repos":
+            url = catalogue.find("github", segments[2])
+            if url is None:
+                return self.send_json({"message": "Not Found"}, 404, headers)
+            return self.send_json({"name": segments[2], "clone_url": url}, headers=headers)
+        self.send_json({"message": "Not Found"}, 404, headers)
+
+    def github_post(self, segments, query, headers):
+        name = self.read_body().get("name")
+        url = self.server.catalogue.create("github", name)
+        self.send_json({"name": name, "clone_url": url}, 201, headers)
+
+    # GitLab: /groups/{id}/projects (id_after keyset paging), /groups/{id}/subgroups,
+    # /projects?search= and POST /projects, plus /projects/{id} for the /api proxy
+    def gitlab_get(self, segments, query, headers):
+        catalogue = self.server.catalogue
+        segments = segments[2:] if segments[:2] == ["api", "v4"] else segments
+        if len(segments) == 3 and segments[0] == "groups" and segments[2] == "projects":
+            group = int(segments[1])
+            groups = [group]
+            if query.get("include_subgroups") == "true":
+                groups = self.descendants(group)
+            per_page = int(query.get("per_page", 20))
+            after = int(query.get("id_after", 0))
+            projects = [catalogue.gitlab_project(group_id, number)
+                        for group_id in groups for number in range(1, catalogue.gitlab_projects + 1)]
+            projects = sorted((project for project in projects if project["id"] > after), key=lambda p: p["id"])
+            if query.get("last_activity_after"):
+                # Timestamps share one format, so they compare as strings
+                projects = [project for project in projects
+                            if project["last_activity_at"] > query["last_activity_after"]]
+            return self.send_json(projects[:per_page], headers=headers)
+        if len(segments) == 3 and segments[0] == "groups" and segments[2] == "subgroups":
+            children = catalogue.subgroups.get(int(segments[1]), [])
+            per_page = int(query.get("per_page", 20))
+            page = int(query.get("page", 1))
+            last = max((len(children) + per_page - 1) // per_page, 1)
+            page_children = children[(page - 1) * per_page:page * per_page]
+            headers["Link"] = self.link_header(f"/gitlab/api/v4/groups/{segments[1]}/subgroups", query, page, last)
+            return self.send_json([{"id": child, "name": f"group-{child}", "full_path": f"group-{child}"}
+                                   for child in page_children], headers=headers)
+        if segments == ["projects"]:
+            name = query.get("search")
+            url = catalogue.find("gitlab", name) if name else None
+            projects = [{"name": name, "path": name, "http_url_to_repo": url}] if url else []
+            return self.send_json(projects, headers=headers)
+        if len(segments) == 2 and segments[0] == "projects" and segments[1].isdigit():
+            project = catalogue.gitlab_project(int(segments[1]) // 100000, int(segments[1]) % 100000)
+            etag = f'W/"{project["id"]}"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            return self.send_json(project, headers=headers)
+        self.send_json({"message": "404 Not Found"}, 404, headers)
+
+    def gitlab_post(self, segments, query, headers):
+        name = self.read_body().get("name")
+        url = self.server.catalogue.create("gitlab", name)
+        self.send_json({"name": name, "http_url_to_repo": url}, 201, headers)
+
+    def descendants(self, group):
+        groups, level = [group], [group]
+        while level:
+            level = [child for parent in level for child in self.server.catalogue.subgroups.get(parent, [])]
+            groups.extend(level)
+        return groups
+
+    # Azure DevOps: /{org}/_apis/projects, /{org}/{project}/_apis/git/repositories[/{name}]
+    def azure_get(self, segments, query, headers):
+        catalogue = self.server.catalogue
+        if len(segments) == 3 and segments[1:] == ["_apis", "projects"]:
+            projects = [{"id": f"project-{number}", "name": f"project-{number}"}
+                        for number in range(1, catalogue.azure_projects + 1)]
+            return self.send_json({"count": len(projects), "value": projects}, headers=headers)
+        if len(segments) == 5 and segments[2:] == ["_apis", "git", "repositories"]:
+            repos = [catalogue.azure_repo(segments[0], segments[1], number)
+                     for number in range(1, catalogue.azure_repos + 1)]
+            return self.send_json({"count": len(repos), "value": repos}, headers=headers)
+        if len(segments) == 6 and segments[2:5] == ["_apis", "git", "repositories"]:
+            url = catalogue.find("azure", segments[5])
+            if url is None:
+                return self.send_json({"message": "Not Found"}, 404, headers)
+            return self.send_json({"name": segments[5], "remoteUrl": url}, headers=headers)
+        self.send_json({"message": "Not Found"}, 404, headers)
+
+    def azure_post(self, segments, query, headers):
+        name = self.read_body().get("name")
+        url = self.server.catalogue.create("azure", name)
+        self.send_json({"name": name, "remoteUrl": url}, 201, headers)
+
+
+class FakePlatforms(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.2, rate_limit=0, rate_window=60.0,
+                 catalogue=None, last_links=True):
+        super().__init__((host, port), FakePlatformHandler)
+        self.latency = latency
+        # Without rel="last" clients have to follow rel="next" page by page
+        self.last_links = last_links
+        self.jitter = jitter
+        self.catalogue = catalogue or Catalogue()
+        self.windows = {platform: RateLimitWindow(rate_limit, rate_window) for platform in ("github", "gitlab", "azure")}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        # Variables that point the service at this server
+        return {
+            "GITHUB_API_URL": f"{self.base_url}/github",
+            "GITLAB_API_URL": f"{self.base_url}/gitlab/api/v4",
+            "AZURE_DEVOPS_URL": f"{self.base_url}/azure",
+        }
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="fake-platforms", daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per window and platform, 0 for none")
+    parser.add_argument("--rate-window", type=float, default=60.0)
+    parser.add_argument("--github-repos", type=int, default=500)
+    parser.add_argument("--no-last-links", action="store_true", help='omit rel="last" from Link headers')
+    parser.add_argument("--repo-root", default=os.path.join(os.getcwd(), "fake-repos"))
+    args = parser.parse_args()
+
+    catalogue = Catalogue(github_repos=args.github_repos, repo_root=args.repo_root)
+    server = FakePlatforms(port=args.port, latency=args.latency, rate_limit=args.rate_limit,
+                           rate_window=args.rate_window, catalogue=catalogue, last_links=not args.no_last_links)
+    for name, value in server.environment().items():
+        print(f"{name}={value}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Bare git repositories of known sizes, used as migration sources by the benchmarks.
+
+History is generated with git fast-import, so even the large preset is built in seconds.
+File contents are random, which keeps packs close to their nominal size.
+"""
+import os
+import subprocess
+
+# commits, files touched per commit, bytes per file, extra branches, tags
+SIZES = {
+    "small": (50, 2, 1024, 2, 2),
+    "medium": (500, 4, 8 * 1024, 5, 10),
+    "large": (2000, 8, 32 * 1024, 10, 20),
+}
+
+
+def fast_import_stream(commits, files_per_commit, file_bytes, branches, tags):
+    for number in range(1, commits + 1):
+        yield b"commit refs/heads/main\n"
+        yield f"mark :{number}\n".encode()
+        yield f"committer Bench <bench@example.com> {1600000000 + number} +0000\n".encode()
+        message = f"Commit {number}\n".encode()
+        yield f"data {len(message)}\n".encode() + message
+        if number > 1:
+            yield f"from :{number - 1}\n".encode()
+        for index in range(files_per_commit):
+            content = os.urandom(file_bytes // 2).hex().encode()
+            yield f"M 100644 inline src/{(number * files_per_commit + index) % 97:02d}/file-{index}.txt\n".encode()
+            yield f"data {len(content)}\n".encode() + content + b"\n"
+        yield b"\n"
+
+    # Branches and tags point at commits spread over the history
+    for index in range(branches):
+        yield f"reset refs/heads/feature-{index}\nfrom :{(index + 1) * commits // (branches + 1) or 1}\n\n".encode()
+    for index in range(tags):
+        yield f"reset refs/tags/v{index}.0\nfrom :{(index + 1) * commits // (tags + 1) or 1}\n\n".encode()
+
+
+def make_repository(path, size="small"):
+    # Returns the file:// URL of a bare repository with the given preset, reusing it when it exists
+    if os.path.isdir(path):
+        return f"file://{path}"
+    commits, files_per_commit, file_bytes, branches, tags = SIZES[size]
+    staging = f"{path}.partial"
+    subprocess.run(["git", "init", "--quiet", "--bare", staging], check=True)
+    process = subprocess.Popen(["git", "--git-dir", staging, "fast-import", "--quiet"], stdin=subprocess.PIPE)
+    for chunk in fast_import_stream(commits, files_per_commit, file_bytes, branches, tags):
+        process.stdin.write(chunk)
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"git fast-import failed for {path}")
+    subprocess.run(["git", "--git-dir", staging, "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+    # Partial clones of the source (strategy=partial) need the server side to allow filters
+    subprocess.run(["git", "--git-dir", staging, "config", "uploadpack.allowFilter", "true"], check=True)
+    os.rename(staging, path)
+    return f"file://{path}"
+
+
+def make_repositories(root, sizes=("small", "medium")):
+    os.makedirs(root, exist_ok=True)
+    return {size: make_repository(os.path.join(root, f"source-{size}.git"), size) for size in sizes}
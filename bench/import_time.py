@@ -0,0 +1,139 @@
+"""Cold-start benchmark: import, startup and first search of the API process.
+
+Each run starts a fresh interpreter, imports move_repo, runs the app's startup hooks and
+serves one /search-repositories request straight through ASGI, timing each phase. It then
+lists which heavy libraries the process ended up loading. A worker that only serves searches
+must not load GitPython or the platform clients, and the script exits non-zero if it does.
+
+    python bench/import_time.py
+    python bench/import_time.py --runs 10 --json import_time.json
+
+`--eager` also times a run that first imports every module the lazy paths defer, together with
+the libraries those modules import at top level, for comparison.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules a search-only worker must not import
+DEFERRED = ("git", "src.transfer", "src.mirror_cache", "src.azure_wrapper")
+# Loaded on first upstream call, reported but not enforced
+WATCHED = DEFERRED + ("requests", "httpx", "src.http_client")
+# What the eager baseline imports up front: the deferred src modules and the libraries they import at top level
+EAGER_MODULES = ("git", "requests", "httpx", "src.http_client", "src.ref_sync", "src.transfer", "src.mirror_cache",
+                 "src.github", "src.gitlab", "src.azure_wrapper", "src.proxy")
+PHASES = ("import_seconds", "startup_seconds", "search_seconds", "total_seconds")
+
+CHILD = r"""
+import asyncio, importlib, json, sys, time
+
+started = time.perf_counter()
+for name in EAGER:
+    importlib.import_module(name)
+import move_repo
+imported = time.perf_counter()
+
+
+async def get(app, path, query):
+    # One HTTP request through the ASGI interface, without an HTTP client library
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "headers": [], "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+    }
+    await app(scope, receive, send)
+    return status.get("code")
+
+
+async def main():
+    await move_repo.app.router.startup()
+    ready = time.perf_counter()
+    code = await get(move_repo.app, "/search-repositories", "query=service")
+    searched = time.perf_counter()
+    await move_repo.app.router.shutdown()
+    return ready, searched, code
+
+ready, searched, code = asyncio.run(main())
+print(json.dumps({
+    "status": code,
+    "import_seconds": imported - started,
+    "startup_seconds": ready - imported,
+    "search_seconds": searched - ready,
+    "total_seconds": searched - started,
+    "loaded": [name for name in WATCHED if name in sys.modules],
+}))
+"""
+
+
+def run_once(workdir, eager):
+    environment = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'repositories.db')}",
+        "LOCK_DIR": os.path.join(workdir, "locks"),
+        "REFRESH_INTERVAL": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    code = f"EAGER = {EAGER_MODULES if eager else ()!r}\nWATCHED = {WATCHED!r}\n{CHILD}"
+    output = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=environment,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(name, runs):
+    summary = {"mode": name, "runs": len(runs), "errors": sum(run["status"] != 200 for run in runs)}
+    for phase in PHASES:
+        summary[phase.replace("_seconds", "_ms")] = round(statistics.median(run[phase] for run in runs) * 1000, 1)
+    summary["loaded"] = sorted(set().union(*(run["loaded"] for run in runs)))
+    return summary
+
+
+def print_table(summaries):
+    columns = ("mode", "runs", "errors", "import_ms", "startup_ms", "search_ms", "total_ms")
+    widths = {column: max(len(column), *(len(str(summary[column])) for summary in summaries)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for summary in summaries:
+        print("  ".join(str(summary[column]).ljust(widths[column]) for column in columns))
+    for summary in summaries:
+        print(f"{summary['mode']}: loaded {', '.join(summary['loaded']) or 'none of ' + ', '.join(WATCHED)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per mode; medians are reported")
+    parser.add_argument("--eager", action="store_true", help="also time a run that imports every deferred library")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="migrator-import-")
+    # A warm-up run creates the schema, so every measured run starts against an existing database
+    run_once(workdir, False)
+    modes = [("lazy", False)] + ([("eager", True)] if args.eager else [])
+    summaries = [summarize(name, [run_once(workdir, eager) for _ in range(args.runs)]) for name, eager in modes]
+    print_table(summaries)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summaries, output, indent=2)
+
+    leaked = set(summaries[0]["loaded"]) & set(DEFERRED)
+    if leaked:
+        print(f"Search-only worker loaded {', '.join(sorted(leaked))}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
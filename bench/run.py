@@ -0,0 +1,332 @@
+"""Load test of the service against local stand-ins for GitHub, GitLab and Azure DevOps.
+
+Starts the fake platforms (bench/fake_platforms.py), builds source repositories
+(bench/git_fixtures.py), runs the FastAPI app under uvicorn in a scratch directory and
+drives it with concurrent HTTP clients. For each scenario it reports throughput and
+p50/p99 latency.
+
+    python bench/run.py
+    python bench/run.py --scenarios listing,search --concurrency 16 --requests 200
+    python bench/run.py --scenarios migration --sizes small,medium --strategy pipeline
+    python bench/run.py --latency 0.1 --rate-limit 300 --json results.json
+    python bench/run.py --scenarios search,proxy --workers 4
+
+Nothing here talks to the real platforms: every upstream URL points at the local fake.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import git_fixtures
+from fake_platforms import Catalogue, FakePlatforms
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("listing", "search", "proxy", "migration")
+SEARCH_TERMS = ("service", "api", "web", "data", "infra", "benchmark", "0001", "serv api")
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def measure(name, call, requests_count, concurrency):
+    # Runs call(index) requests_count times over concurrency threads; call returns True on success
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed(index):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = call(index)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(requests_count)))
+    wall = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "throughput": round(requests_count / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+class Service:
+    # The FastAPI app under uvicorn on a free local port, configured through the environment. With more
+    # than one worker, uvicorn runs as a separate process tree sharing the port, database and caches
+    def __init__(self, environment, workdir, workers=1):
+        self.environment = environment
+        self.workdir = workdir
+        self.workers = workers
+        self.port = self.free_port()
+        self.server = None
+        self.process = None
+        self.local = threading.local()
+
+    def free_port(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            return probe.getsockname()[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        if self.workers > 1:
+            return self.start_workers()
+        import uvicorn
+        os.environ.update(self.environment)
+        # repositories.db and the other local files are created relative to the working directory
+        os.chdir(self.workdir)
+        sys.path.insert(0, REPO_ROOT)
+        import move_repo
+
+        config = uvicorn.Config(move_repo.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        threading.Thread(target=self.server.run, name="uvicorn", daemon=True).start()
+        deadline = time.time() + 30
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Service did not start")
+            time.sleep(0.05)
+        return self
+
+    def start_workers(self):
+        environment = {**os.environ, **self.environment, "PYTHONPATH": REPO_ROOT}
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "move_repo:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=self.workdir, env=environment)
+        deadline = time.time() + 60
+        while True:
+            try:
+                if requests.get(f"{self.url}/metrics", timeout=1).ok:
+                    return self
+            except requests.ConnectionError:
+                pass
+            if self.process.poll() is not None or time.time() > deadline:
+                raise RuntimeError("Service did not start")
+            time.sleep(0.1)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.should_exit = True
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+    def session(self):
+        # One keep-alive session per client thread
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def get(self, path, **kwargs):
+        return self.session().get(f"{self.url}{path}", timeout=600, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.session().post(f"{self.url}{path}", timeout=600, **kwargs)
+
+
+def listing_scenarios(service, args, platforms):
+    results = []
+    for platform in args.platforms:
+        def call(index, platform=platform):
+            response = service.get(f"/repositories/{platform}", params={"per_page": args.per_page})
+            return response.status_code == 200
+        results.append(measure(f"listing:{platform}", call, args.listing_requests, args.concurrency))
+
+    if "github" in args.platforms:
+        # Link headers without rel="last" are followed page by page; every repository must come back once.
+        # A different page size keeps the cached pages of the scenario above out of it
+        per_page = max(args.per_page // 2, 1)
+
+        def call(index):
+            response = service.get("/repositories/github", params={"per_page": per_page})
+            if response.status_code != 200:
+                return False
+            names = [repo["name"] for repo in response.json()["repositories"]]
+            return len(names) == len(set(names)) == args.github_repos
+
+        platforms.last_links = False
+        try:
+            results.append(measure("listing:github:next-only", call, args.listing_requests, args.concurrency))
+        finally:
+            platforms.last_links = True
+    return results
+
+
+def search_scenarios(service, args):
+    # The catalogue is filled once through the normal indexing path before searching it
+    for platform in args.platforms:
+        response = service.get(f"/repositories/{platform}", params={"per_page": 100, "indexing": "true"})
+        response.raise_for_status()
+
+    def call(index):
+        query = SEARCH_TERMS[index % len(SEARCH_TERMS)]
+        response = service.get("/search-repositories", params={"query": query, "per_page": 20})
+        return response.status_code == 200
+
+    return [measure("search", call, args.requests, args.concurrency)]
+
+
+def proxy_scenarios(service, args):
+    def call(index):
+        # A small working set, so both cache hits and upstream round trips are exercised
+        project_id = 100000 + random.randint(1, 50)
+        response = service.get(f"/api/projects/{project_id}")
+        return response.status_code == 200
+
+    return [measure("proxy", call, args.requests, args.concurrency)]
+
+
+def migration_scenarios(service, args, sources):
+    results = []
+    for size, source_url in sources.items():
+        def call(index, size=size, source_url=source_url):
+            body = {
+                "repo_name": f"bench-{size}-{args.strategy}-{index}-{random.getrandbits(32):08x}",
+                "source_repo_url": source_url,
+                "strategy": args.strategy,
+            }
+            response = service.post(f"/move-repository/gitlab/{args.target}", json=body)
+            if not response.ok:
+                return False
+            status_url = response.json()["status_url"]
+            while True:
+                job = service.get(status_url).json()
+                if job["state"] in ("succeeded", "failed"):
+                    return job["state"] == "succeeded"
+                time.sleep(0.05)
+
+        results.append(measure(f"migration:{size}:{args.strategy}", call, args.migrations,
+                               args.migration_concurrency))
+    return results
+
+
+def print_table(results):
+    columns = ("scenario", "requests", "concurrency", "errors", "seconds", "throughput", "p50_ms", "p99_ms")
+    widths = {column: max(len(column), *(len(str(result[column])) for result in results)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(widths[column]) for column in columns))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--platforms", default="github,gitlab,azure")
+    parser.add_argument("--requests", type=int, default=200, help="requests per search and proxy scenario")
+    parser.add_argument("--listing-requests", type=int, default=20, help="full listings per platform")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the fake platforms add to each response")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests per window and platform, 0 for none")
+    parser.add_argument("--rate-window", type=float, default=60.0)
+    parser.add_argument("--github-repos", type=int, default=1000)
+    parser.add_argument("--gitlab-depth", type=int, default=2)
+    parser.add_argument("--gitlab-fanout", type=int, default=3)
+    parser.add_argument("--gitlab-projects", type=int, default=20, help="projects per GitLab group")
+    parser.add_argument("--sizes", default="small,medium", help="source repository presets: " + ", ".join(git_fixtures.SIZES))
+    parser.add_argument("--migrations", type=int, default=8, help="migrations per repository size")
+    parser.add_argument("--migration-concurrency", type=int, default=4)
+    parser.add_argument("--strategy", default="mirror", help="transfer strategy for migrations")
+    parser.add_argument("--target", default="github", help="target platform for migrations")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes serving the app")
+    parser.add_argument("--workdir", help="keep databases, caches and repositories here instead of a temp dir")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    args.scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    args.platforms = [platform.strip() for platform in args.platforms.split(",") if platform.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_args()
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="migrator-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+
+    catalogue = Catalogue(github_repos=args.github_repos, gitlab_fanout=args.gitlab_fanout,
+                          gitlab_depth=args.gitlab_depth, gitlab_projects=args.gitlab_projects,
+                          repo_root=os.path.join(workdir, "targets"))
+    platforms = FakePlatforms(latency=args.latency, rate_limit=args.rate_limit, rate_window=args.rate_window,
+                              catalogue=catalogue).start()
+
+    environment = {
+        **platforms.environment(),
+        "GITLAB_TOKEN": "bench", "ORG_GITHUB_TOKEN": "bench", "AZURE_TOKEN": "bench",
+        "GITLAB_GROUP_ID": "1", "NAME_GITHUB_ORGANIZATION": "bench", "AZURE_ORGANIZATION": "bench",
+        "MIRROR_CACHE_DIR": os.path.join(workdir, "mirror-cache"),
+        "SCRATCH_DIR": os.path.join(workdir, "scratch"),
+        "RESPONSE_CACHE_PATH": os.path.join(workdir, "response_cache.db"),
+        "LOCK_DIR": os.path.join(workdir, "locks"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        # Background catalogue refreshes would add upstream load the scenarios do not ask for
+        "REFRESH_INTERVAL": "0",
+    }
+
+    sources = {}
+    if "migration" in args.scenarios:
+        sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+        print(f"Building source repositories ({', '.join(sizes)}) in {workdir}", file=sys.stderr)
+        sources = git_fixtures.make_repositories(os.path.join(workdir, "sources"), sizes)
+
+    if args.workers > 1:
+        # The workers share one response cache on disk instead of one in memory each
+        environment.setdefault("RESPONSE_CACHE", os.getenv("RESPONSE_CACHE", "sqlite"))
+    service = Service(environment, workdir, args.workers).start()
+    results = []
+    try:
+        if "listing" in args.scenarios:
+            results.extend(listing_scenarios(service, args, platforms))
+        if "search" in args.scenarios:
+            results.extend(search_scenarios(service, args))
+        if "proxy" in args.scenarios:
+            results.extend(proxy_scenarios(service, args))
+        if "migration" in args.scenarios:
+            results.extend(migration_scenarios(service, args, sources))
+    finally:
+        service.stop()
+        platforms.shutdown()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump({"workdir": workdir, "arguments": vars(args), "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,38 @@
-from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
+from fastapi import FastAPI, HTTPException, Body, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from typing import Any, Optional
-from git import Repo, GitCommandError
+from typing import Any, List, Optional
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, String, Integer
+from sqlalchemy import inspect, Boolean, Column, Float, String, Integer, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from functools import wraps
+from functools import cached_property, wraps
+from concurrent.futures import as_completed
+
+from src.checkpoints import CheckpointStore
+from src.jobs import JobQueue
+from src.leases import MigrationLeases
+from src.locks import FileLock, lock_path
+from src.database import make_engine
+from src.indexer import Indexer
+from src.refresher import CatalogueRefresher
+from src.search import SearchIndex
+from src.response_cache import get_response_cache
+import src.ratelimit as ratelimit
+import src.metrics as metrics
+from src.metrics import span
 
-import src.github as GitHub
-import src.gitlab as GitLab
-import src.azure_wrapper as Azure
-
-import requests
 import os
-import shutil
-import subprocess
+import sys
+import logging
+import time
+import uuid
+import fnmatch
+import itertools
+import json
 
 app = FastAPI()
 origins = [
@@ -32,13 +47,19 @@ app.add_middleware(
 )
 
 load_dotenv()
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 Base = declarative_base()
 
 class Repository(Base):
     __tablename__ = 'repositories'
+    __table_args__ = (
+        UniqueConstraint('platform', 'external_id', name='uq_repositories_platform_external_id'),
+    )
 
     id = Column(Integer, primary_key=True)
-    gitlab_id = Column(Integer, unique=True)
+    external_id = Column(String, nullable=False)
     name = Column(String, index=True)
     description = Column(String)
     path = Column(String)
@@ -48,177 +69,635 @@ class Repository(Base):
     ssh_url_to_repo = Column(String)
     http_url_to_repo = Column(String)
     last_activity_at = Column(String)
-    platform = Column(String)
+    platform = Column(String, nullable=False)
+    last_indexed_at = Column(String)
+
+class MigrationCheckpoint(Base):
+    # One row per queued migration, so a retry or a restarted service resumes from the last completed stage
+    __tablename__ = 'migration_checkpoints'
+
+    id = Column(String, primary_key=True)
+    # Worker process that runs the migration, and when it last renewed its lease
+    owner = Column(String)
+    heartbeat_at = Column(Float)
+    progress = Column(Text)
+    source_platform = Column(String)
+    target_platform = Column(String, nullable=False)
+    source_repo_url = Column(String, nullable=False)
+    repo_name = Column(String, nullable=False)
+    project = Column(String)
+    sync = Column(Boolean, default=False)
+    strategy = Column(String)
+    lfs = Column(Boolean, default=False)
+    state = Column(String, index=True)
+    stage = Column(String)
+    target_repo_url = Column(String)
+    clone_complete = Column(Boolean, default=False)
+    pushed_refs = Column(Text)
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(Float)
+    updated_at = Column(Float)
 
 class RepositoryObject(BaseModel):
     repo_name: str
     source_repo_url: str
     organization: str = None
     project: str = None
+    sync: bool = False
+    strategy: str = "mirror"
+    lfs: bool = False
+
+class BulkMigrationObject(BaseModel):
+    group: Optional[str] = None
+    name_pattern: Optional[str] = None
+    ids: Optional[List[int]] = None
+    project: str = None
+    sync: bool = False
+    strategy: str = "mirror"
+    lfs: bool = False
 
 #decorator to save repositories to database
 def save_repositories_decorator(func):
     @wraps(func)
-    def wrapper(*args, **kwargs):
+    def wrapper(self, platform, *args, **kwargs):
         # Check if 'indexing' parameter is provided and is True
         indexing = kwargs.get('indexing', False)
         if not indexing:
-            return func(*args, **kwargs)
+            return func(self, platform, *args, **kwargs)
 
         # Proceed with the original functionality if indexing is True
-        response = func(*args, **kwargs)
+        response = func(self, platform, *args, **kwargs)
         repositories = response.get('repositories', []) if isinstance(response, dict) else []
 
         if repositories:
-            session = Session()
-            for repo in repositories:
-                db_repo = Repository(
-                    gitlab_id=repo.get('id'),
-                    name=repo.get('name'),
-                    description=repo.get('description'),
-                    path=repo.get('path'),
-                    created_at=repo.get('created_at'),
-                    default_branch=repo.get('default_branch'),
-                    web_url=repo.get('web_url'),
-                    ssh_url_to_repo=repo.get('ssh_url_to_repo'),
-                    http_url_to_repo=repo.get('http_url_to_repo'),
-                    last_activity_at=repo.get('last_activity_at'),
-                    platform=kwargs.get('platform', 'unknown')
-                )
-                session.add(db_repo)
-            session.commit()
+            # A single page is not the whole catalogue, so only full listings may delete repositories
+            pagination = kwargs.get('pagination', args[1] if len(args) > 1 else False)
+            response['indexing'] = indexer.index(platform, repositories, prune=not pagination)
 
         return response
     return wrapper
 
 class RepoMigrator:
-    def __init__(self):
+    def __init__(self, checkpoints=None):
         self.gitlab_token = os.getenv('GITLAB_TOKEN')
         self.github_token = os.getenv('ORG_GITHUB_TOKEN')
         self.azure_token = os.getenv('AZURE_TOKEN')
         self.gitlab_group_id = os.getenv('GITLAB_GROUP_ID')
         self.github_organization = os.getenv('NAME_GITHUB_ORGANIZATION')
         self.azure_organization = os.getenv('AZURE_ORGANIZATION')
-        self.github = GitHub.GitHub(self.github_token)
-        self.gitlab = GitLab.GitLab(self.gitlab_token)
-        self.azure = Azure.Azure(self.azure_organization, self.azure_token)
+        self.checkpoints = checkpoints
+
+    # Clients, and the libraries behind them, are imported and built the first time a request needs them,
+    # so a worker that only serves searches never loads GitPython or the HTTP client stack
+    @cached_property
+    def github(self):
+        import src.github as GitHub
+        return GitHub.GitHub(self.github_token)
+
+    @cached_property
+    def gitlab(self):
+        import src.gitlab as GitLab
+        return GitLab.GitLab(self.gitlab_token)
+
+    @cached_property
+    def azure(self):
+        import src.azure_wrapper as Azure
+        return Azure.Azure(self.azure_organization, self.azure_token)
+
+    @cached_property
+    def mirror_cache(self):
+        from src.mirror_cache import get_mirror_cache
+        return get_mirror_cache()
 
     @save_repositories_decorator
-    def get_all_repositories(self, platform, per_page, pagination = False, indexing = False):
+    def get_all_repositories(self, platform, per_page, pagination = False, indexing = False, group = None, include_subgroups = False):
         if platform.lower() == "gitlab":
-            return self.gitlab.get_all_repositories(self.gitlab_group_id, pagination, per_page) 
+            return self.gitlab.get_all_repositories(group or self.gitlab_group_id, pagination, per_page,
+                                                    include_subgroups=include_subgroups)
         elif platform.lower() == "github":
-            return self.github.get_all_repositories(self.github_organization, pagination, per_page)
+            return self.github.get_all_repositories(group or self.github_organization, pagination, per_page)
         elif platform.lower() == "azure":
-            return self.azure.get_all_repositories()
+            return self.azure.get_all_repositories(group)
         else:
             raise ValueError("Unsupported platform")
 
-    def move_repository(self, source_repo_url, target_platform, repo_name, project=''):
-        local_dir = f"/tmp/{repo_name}"
-        # Clean up the local repository directory
-        if os.path.exists(local_dir):
-            shutil.rmtree(local_dir)
-
-        # Create a new repository on the target platform
-        if target_platform.lower() == "github":
-            new_repo_url = self.github.create_repository(repo_name, self.github_token)
-        elif target_platform.lower() == "azure":
-            new_repo_url = self.azure.create_repository(repo_name, self.azure_token, project)
-        elif target_platform.lower() == "gitlab":
-            new_repo_url = self.gitlab.create_repository(repo_name, self.gitlab_token)
+    def iter_repositories(self, platform, per_page, group = None, include_subgroups = False):
+        if platform.lower() == "gitlab":
+            return self.gitlab.iter_repositories(group or self.gitlab_group_id, per_page,
+                                                 include_subgroups=include_subgroups)
+        elif platform.lower() == "github":
+            return self.github.iter_repositories(group or self.github_organization, per_page)
+        elif platform.lower() == "azure":
+            return self.azure.iter_repositories(group)
         else:
-            raise ValueError("Unsupported target platform")
-
-        subprocess.run(["git", "config", "--global", "credential.helper", "cache --timeout=600"])
-        # Clone the repository from the source
-        repo = Repo.clone_from(source_repo_url, local_dir, mirror=True)
+            raise ValueError("Unsupported platform")
 
-        # Change the remote URL to the new repository
-        repo.git.remote('set-url', 'origin', new_repo_url)
+    def iter_changed_repositories(self, platform, since):
+        # Repositories changed upstream after `since`, for incremental catalogue refreshes
+        if platform.lower() == "gitlab":
+            return self.gitlab.iter_changed_repositories(self.gitlab_group_id, since)
+        elif platform.lower() == "github":
+            return self.github.iter_updated_repositories(self.github_organization, since)
+        elif platform.lower() == "azure":
+            return self.azure.iter_changed_repositories(since)
+        else:
+            raise ValueError("Unsupported platform")
 
-        # Push all branches and tags
-        try:
-            #repo.git.push('--all')
-            repo.git.push()
-        except GitCommandError as e:
-            raise Exception(f"Failed to push to the target repository: {e}")
+    def configured_platforms(self):
+        # Platforms with both credentials and a group/organization to list
+        configured = {
+            "gitlab": self.gitlab_token and self.gitlab_group_id,
+            "github": self.github_token and self.github_organization,
+            "azure": self.azure_token and self.azure_organization,
+        }
+        return [platform for platform, ready in configured.items() if ready]
+
+    def client_for(self, platform):
+        if not platform or platform.lower() not in ("github", "gitlab", "azure"):
+            return None
+        return getattr(self, platform.lower())
+
+    def select_repositories(self, source_platform, group=None, name_pattern=None, ids=None):
+        # Pick the repositories for a bulk migration, either from the index or from a live listing
+        if ids:
+            with Session() as session:
+                rows = (session.query(Repository)
+                        .filter(Repository.id.in_(ids), Repository.platform == source_platform.lower())
+                        .all())
+                repositories = [{"repo_name": row.name, "source_repo_url": row.http_url_to_repo} for row in rows]
+        else:
+            listing = self.get_all_repositories(source_platform, 100, group=group)
+            repositories = [
+                {
+                    "repo_name": repo.get('path') or repo.get('name'),
+                    "source_repo_url": repo.get('http_url_to_repo') or repo.get('clone_url') or repo.get('remoteUrl')
+                }
+                for repo in listing.get('repositories', [])
+            ]
 
-        # Clean up the local repository directory
-        if os.path.exists(local_dir):
-            shutil.rmtree(local_dir)
+        if name_pattern:
+            repositories = [repo for repo in repositories if fnmatch.fnmatch(repo["repo_name"], name_pattern)]
+        return [repo for repo in repositories if repo["source_repo_url"]]
 
+    def find_repository(self, target_platform, repo_name, project=''):
+        if target_platform.lower() == "github":
+            return self.github.get_repository(repo_name, self.github_token)
+        elif target_platform.lower() == "azure":
+            return self.azure.get_repository(project, self.azure_token, repo_name)
+        return self.gitlab.get_repository(repo_name, self.gitlab_token)
 
-# Set up the engine and session
-engine = create_engine('sqlite:///repositories.db', echo=True)
+    def create_repository(self, target_platform, repo_name, project=''):
+        if target_platform.lower() == "github":
+            return self.github.create_repository(repo_name, self.github_token)
+        elif target_platform.lower() == "azure":
+            return self.azure.create_repository(project, self.azure_token, repo_name)
+        return self.gitlab.create_repository(repo_name, self.gitlab_token)
+
+    def run_migration(self, job_id, progress=None):
+        # Runs a queued migration from its checkpoint. Failed attempts are retried with backoff, and each
+        # attempt (like a restart after a crash) resumes from the last stage the checkpoint recorded
+        progress = progress or (lambda stage, **info: None)
+        retries = int(os.getenv('MIGRATION_RETRIES', 2))
+        delay = float(os.getenv('MIGRATION_RETRY_DELAY', 10))
+        checkpoint = self.checkpoints.load(job_id)
+        attempt = 0
+        while True:
+            attempt += 1
+            checkpoint.save(state="running", attempts=checkpoint.get("attempts", 0) + 1, error=None)
+            try:
+                result = self.move_repository(
+                    checkpoint.get("source_repo_url"), checkpoint.get("target_platform"), checkpoint.get("repo_name"),
+                    checkpoint.get("project"), checkpoint.get("source_platform"), checkpoint.get("sync", False),
+                    checkpoint.get("strategy", "mirror"), checkpoint.get("lfs", False), progress, checkpoint,
+                )
+            except Exception as e:
+                if attempt > retries:
+                    checkpoint.save(state="failed", error=str(e))
+                    raise
+                wait = delay * 2 ** (attempt - 1)
+                logger.warning("Migration %s attempt %s failed, retrying in %.0fs: %s", job_id, attempt, wait, e)
+                checkpoint.save(error=str(e))
+                progress("retrying", attempt=attempt, retries=retries, seconds=wait, error=str(e))
+                time.sleep(wait)
+                continue
+            checkpoint.save(state="succeeded", stage="pushed")
+            return result
+
+    def move_repository(self, source_repo_url, target_platform, repo_name, project='', source_platform=None, sync=False, strategy='mirror', lfs=False, progress=None, checkpoint=None):
+        from git import GitCommandError
+        from src.transfer import get_transfer
+        import src.ref_sync as ref_sync
+
+        target = self.client_for(target_platform)
+        if target is None:
+            raise ValueError("Unsupported target platform")
+        source = self.client_for(source_platform) or target
+        progress = progress or (lambda stage, **info: None)
+        transfer = get_transfer(strategy, progress, lfs)
+
+        # A target created by an earlier attempt is reused instead of failing to create it again
+        resumed = checkpoint is not None and checkpoint.get("target_repo_url") is not None
+        progress("create-target")
+        if resumed:
+            new_repo_url = checkpoint.get("target_repo_url")
+            created = False
+        else:
+            # Create a new repository on the target platform, or reuse the existing one when syncing
+            with target.rate_limiter.slot(), span("create-target", target_platform):
+                new_repo_url = self.find_repository(target_platform, repo_name, project) if sync else None
+                created = new_repo_url is None
+                if created:
+                    new_repo_url = self.create_repository(target_platform, repo_name, project)
+            if checkpoint is not None:
+                checkpoint.save(stage="target-created", target_repo_url=new_repo_url)
+
+        result = {"repo_name": repo_name, "target_platform": target_platform, "target_repo_url": new_repo_url,
+                  "strategy": transfer.name}
+
+        refspecs = None
+        updated = None
+        if not created:
+            # Compare ref tips on both sides first; an up-to-date target needs no fetch or push at all.
+            # A resumed migration takes the same path, so refs an earlier attempt pushed are skipped
+            with source.rate_limiter.slot(), span("ls-remote", source_platform):
+                source_refs = ref_sync.ls_remote(source_repo_url)
+            with target.rate_limiter.slot(), span("ls-remote", target_platform):
+                target_refs = ref_sync.ls_remote(new_repo_url)
+            updated, deleted = ref_sync.diff_refs(source_refs, target_refs)
+            result.update({"sync": sync, "resumed": resumed, "updated_refs": updated, "deleted_refs": deleted})
+            if not updated and not deleted:
+                return result
+            refspecs = ref_sync.refspecs(updated, deleted)
+
+        if not transfer.uses_mirror:
+            # Pipeline mode streams batches through scratch space instead of keeping a full mirror
+            if checkpoint is not None:
+                checkpoint.save(stage="pushing")
+            try:
+                with ratelimit.slots(source.rate_limiter, target.rate_limiter), span("pipeline", target_platform):
+                    transfer.transfer(source_repo_url, new_repo_url, refspecs)
+            except GitCommandError as e:
+                raise Exception(f"Failed to transfer to the target repository: {e}")
+            if checkpoint is not None and updated:
+                checkpoint.add_pushed_refs(updated)
+            progress("done")
+            return result
+
+        # Reuse the cached mirror of the source, fetching only what changed since the last run
+        with self.mirror_cache.checkout(source_repo_url, transfer.clone_filter):
+            progress("clone")
+            with source.rate_limiter.slot(), span("clone", source_platform):
+                repo = self.mirror_cache.update(source_repo_url, transfer.clone_filter, progress)
+            if checkpoint is not None:
+                checkpoint.save(stage="cloned", clone_complete=True)
+
+            # Push straight to the new repository, leaving the mirror's origin intact
+            progress("push")
+            if checkpoint is not None:
+                checkpoint.save(stage="pushing")
+            try:
+                with target.rate_limiter.slot(), span("push", target_platform):
+                    transfer.push(repo, new_repo_url, refspecs)
+            except GitCommandError as e:
+                raise Exception(f"Failed to push to the target repository: {e}")
+            if checkpoint is not None:
+                checkpoint.add_pushed_refs(updated if updated is not None else ref_sync.ls_remote(repo.git_dir))
+
+        progress("done")
+        return result
+
+
+# Set up the engine and session (DATABASE_URL, pooled; SQLite runs in WAL mode)
+engine = make_engine()
 Session = sessionmaker(bind=engine)
 
-# Create tables
-Base.metadata.create_all(engine)
-
+# The repositories table is a cache of upstream listings. The original layout keyed rows on a GitLab-only
+# unique id and cannot be upserted into, so it is rebuilt; the next indexing run repopulates it
+search_index = SearchIndex(engine, Repository)
+
+# Schema setup runs when the server starts rather than on import, once in every worker process
+# and one worker at a time. Registered first, so it completes before the other startup hooks
+@app.on_event("startup")
+def setup_database():
+    with FileLock(lock_path("schema")):
+        inspector = inspect(engine)
+        if inspector.has_table('repositories') and 'external_id' not in {column['name'] for column in inspector.get_columns('repositories')}:
+            Repository.__table__.drop(engine)
+            search_index.drop()
+
+        # Create tables, plus the full-text index that triggers keep in sync with every indexing run
+        Base.metadata.create_all(engine)
+        search_index.ensure()
+
+indexer = Indexer(Session, Repository)
+checkpoints = CheckpointStore(Session, MigrationCheckpoint)
+
+# Migrations run on a bounded worker pool so clone/push never blocks the event loop
+job_queue = JobQueue()
+proxy = None
+
+def get_proxy():
+    # Built on the first proxied request, so workers that never proxy do not load the HTTP client stack
+    global proxy
+    if proxy is None:
+        from src.proxy import ReverseProxy
+        proxy = ReverseProxy()
+    return proxy
+
+def collect_metrics():
+    # Queue depth and cache counters are read when /metrics is scraped rather than tracked on every change
+    for state, count in job_queue.stats().items():
+        metrics.JOBS.set(count, state=state)
+    cache = get_response_cache()
+    if cache is not None:
+        for stat, value in cache.stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics.RESPONSE_CACHE.set(value, stat=stat)
+
+metrics.REGISTRY.add_collector(collect_metrics)
+
+def migration_params(checkpoint):
+    return {name: checkpoint[name] for name in ("repo_name", "source_platform", "target_platform", "sync", "strategy", "lfs")}
+
+def get_migrator():
+    # Request-scoped: each request and each queued migration gets its own RepoMigrator. Everything shared
+    # (HTTP pools, rate limiters, mirror cache, jobs) is process-wide or in the database, never on the clients
+    return RepoMigrator(checkpoints)
+
+def submit_migration(checkpoint):
+    return job_queue.submit("move-repository", get_migrator().run_migration, checkpoint["id"],
+                            params=migration_params(checkpoint), with_progress=True, job_id=checkpoint["id"])
+
+# Migrations are owned by the worker that queued them; leases hand them over when a worker goes away
+leases = MigrationLeases(checkpoints, job_queue, submit_migration)
+
+def queue_migration(source_repo_url, target_platform, repo_name, project, source_platform, sync, strategy, lfs):
+    # A new request for a migration that failed part-way adopts its progress: the target it created,
+    # and the refs it already pushed, so only the rest is transferred
+    job_id = uuid.uuid4().hex
+    previous = checkpoints.adopt(job_id, source_repo_url, target_platform, repo_name, project) or {}
+    checkpoint = checkpoints.create(
+        job_id,
+        owner=leases.owner,
+        source_platform=source_platform,
+        target_platform=target_platform.lower(),
+        source_repo_url=source_repo_url,
+        repo_name=repo_name,
+        project=project,
+        sync=sync,
+        strategy=strategy,
+        lfs=lfs,
+        target_repo_url=previous.get("target_repo_url"),
+        clone_complete=previous.get("clone_complete", False),
+        pushed_refs=previous.get("pushed_refs", []),
+    )
+    return submit_migration(checkpoint.data)
+
+@app.on_event("startup")
+def configure_git():
+    # Every git command this process runs caches credentials for 10 minutes. Set once through GIT_CONFIG_*
+    # variables, which git reads per command, instead of each job rewriting the user's global git config
+    count = int(os.environ.get("GIT_CONFIG_COUNT", 0))
+    settings = [(os.environ.get(f"GIT_CONFIG_KEY_{index}"), os.environ.get(f"GIT_CONFIG_VALUE_{index}"))
+                for index in range(count)]
+    if ("credential.helper", "cache --timeout=600") in settings:
+        return
+    os.environ.update({
+        f"GIT_CONFIG_KEY_{count}": "credential.helper",
+        f"GIT_CONFIG_VALUE_{count}": "cache --timeout=600",
+        "GIT_CONFIG_COUNT": str(count + 1),
+    })
+
+@app.on_event("startup")
+async def start_refresher():
+    refresher.start()
+
+@app.on_event("startup")
+async def start_leases():
+    # Migrations left unfinished by a stopped or crashed worker are picked up again under the same job id
+    leases.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    refresher.stop()
+    leases.stop()
+    job_queue.shutdown()
+    # Only a worker that made upstream calls has HTTP clients to close
+    http_client = sys.modules.get("src.http_client")
+    if http_client is not None:
+        await http_client.close_http_clients()
 
 
 @app.get("/repositories/{platform}")
-async def get_repositories(platform: str, indexing: bool = Query(False, alias="indexing"), pagination: bool = Query(False, alias="pagination"), per_page: int = Query(20, alias="per_page")):
+async def get_repositories(platform: str, indexing: bool = Query(False, alias="indexing"), pagination: bool = Query(False, alias="pagination"), per_page: int = Query(20, alias="per_page"), stream: bool = Query(False, alias="stream"), include_subgroups: bool = Query(False, alias="include_subgroups"), migrator: RepoMigrator = Depends(get_migrator)):
+    if stream:
+        # Indexing a full listing prunes what is missing from it, so it needs the whole listing at once
+        if indexing:
+            raise HTTPException(status_code=400, detail="indexing cannot be combined with stream")
+        try:
+            # The first page is fetched before responding, so a failing upstream still gets a 500
+            repositories = migrator.iter_repositories(platform, per_page, include_subgroups=include_subgroups)
+            first = await run_in_threadpool(next, repositories, None)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if first is not None:
+            repositories = itertools.chain([first], repositories)
+
+        # One repository per line, written as each upstream page arrives
+        def lines():
+            try:
+                for repo in repositories:
+                    yield json.dumps(repo) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    try:
+        # Upstream calls and indexing block, so they run in the threadpool rather than on the event loop
+        return await run_in_threadpool(migrator.get_all_repositories, platform, per_page, pagination,
+                                       indexing=indexing, include_subgroups=include_subgroups)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/gitlab/groups/{group_id}/subgroups")
+async def get_gitlab_subgroups(group_id: str, migrator: RepoMigrator = Depends(get_migrator)):
     try:
-        return migrator.get_all_repositories(platform, per_page, pagination)
+        subgroups, report = await run_in_threadpool(migrator.gitlab.walk_subgroups, group_id)
+        return {"subgroups": subgroups, "report": report}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/move-repository/{source_platform}/{target_platform}")
+def check_strategy(strategy):
+    # src.transfer pulls in GitPython, so it is first imported by a migration request
+    from src.transfer import STRATEGIES
+    if strategy.lower() not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unsupported transfer strategy: {strategy}")
+
+@app.post("/move-repository/{source_platform}/{target_platform}", status_code=202)
 async def move_repository(source_platform: str, target_platform: str, repo_obj: RepositoryObject = Body(...)):
+    check_strategy(repo_obj.strategy)
     try:
-        # Call the move_repository method with appropriate parameters
-        migrator.move_repository(
-            repo_obj.source_repo_url, 
-            target_platform, 
-            repo_obj.repo_name, 
-            repo_obj.project
+        # Checkpoint and queue the migration, then return straight away with the job id
+        job = await run_in_threadpool(
+            queue_migration,
+            repo_obj.source_repo_url,
+            target_platform,
+            repo_obj.repo_name,
+            repo_obj.project,
+            source_platform,
+            repo_obj.sync,
+            repo_obj.strategy,
+            repo_obj.lfs
         )
-        return {"message": f"Repository {repo_obj.repo_name} moved from {source_platform} to {target_platform}"}
+        return {
+            "message": f"Repository {repo_obj.repo_name} queued for move from {source_platform} to {target_platform}",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}"
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.api_route("/api/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
-async def forward_request(path: str, request: Request):
-    # Construct the new URL for GitLab
-    new_url = f"https://gitlab.com/api/v4/{path}"
+@app.post("/move-repositories/{source_platform}/{target_platform}")
+async def move_repositories(source_platform: str, target_platform: str, bulk_obj: BulkMigrationObject = Body(...), migrator: RepoMigrator = Depends(get_migrator)):
+    check_strategy(bulk_obj.strategy)
+    try:
+        repositories = await run_in_threadpool(
+            migrator.select_repositories,
+            source_platform,
+            bulk_obj.group,
+            bulk_obj.name_pattern,
+            bulk_obj.ids
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    # Forward the request to GitLab
-    method = request.method.lower()
-    headers = {key: value for key, value in request.headers.items() if key.lower() != 'host'}
-    content = await request.body()
-    
-    # Make the request to GitLab
-    response = requests.request(method, new_url, headers=headers, data=content, allow_redirects=False)
+    def queue_all():
+        return [
+            queue_migration(
+                repo["source_repo_url"],
+                target_platform,
+                repo["repo_name"],
+                bulk_obj.project,
+                source_platform,
+                bulk_obj.sync,
+                bulk_obj.strategy,
+                bulk_obj.lfs
+            )
+            for repo in repositories
+        ]
 
-    # Return the response received from GitLab
-    return Response(content=response.content, status_code=response.status_code, headers=dict(response.headers))
+    try:
+        jobs = await run_in_threadpool(queue_all)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Stream one NDJSON line per repository as its migration finishes
+    def results():
+        yield json.dumps({"selected": len(jobs), "job_ids": [job.id for job in jobs]}) + "\n"
+        futures = {job.future: job for job in jobs}
+        for future in as_completed(futures):
+            yield json.dumps(futures[future].to_dict()) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/catalogue/refresh")
+async def get_catalogue_refresh():
+    return refresher.stats()
+
+@app.post("/catalogue/refresh", status_code=202)
+async def trigger_catalogue_refresh(full: bool = Query(False, alias="full")):
+    if refresher.thread is None:
+        raise HTTPException(status_code=409, detail="Catalogue refresh is disabled (REFRESH_INTERVAL=0 or no platform configured)")
+    if not refresher.leader.held:
+        raise HTTPException(status_code=409, detail="Catalogue refresh runs in another worker process")
+    refresher.trigger(full)
+    return {"message": "Catalogue refresh triggered", "full": full}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    # Migrations from before a restart, or pruned from the in-memory history, are still checkpointed
+    checkpoint = await run_in_threadpool(checkpoints.load, job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {"id": job_id, "kind": "move-repository", "params": migration_params(checkpoint.data), **checkpoint.data}
+
+@app.get("/jobs/{job_id}/checkpoint")
+async def get_job_checkpoint(job_id: str):
+    checkpoint = await run_in_threadpool(checkpoints.load, job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"No checkpoint for job {job_id}")
+    return checkpoint.data
+
+@app.post("/jobs/{job_id}/retry", status_code=202)
+async def retry_job(job_id: str):
+    checkpoint = await run_in_threadpool(checkpoints.load, job_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail=f"No checkpoint for job {job_id}")
+    if checkpoint.get("state") == "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already succeeded")
+    if checkpoint.get("state") == "superseded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} was superseded by a newer migration of the same repository")
+    # Only a failed migration can be claimed, so concurrent retries (from any worker) queue it once
+    if not await run_in_threadpool(checkpoints.claim, job_id, leases.owner, ("failed",), state="queued", error=None):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is still {checkpoint.get('state')}")
+    # Resumes from the checkpoint under the same job id
+    submit_migration(checkpoint.data)
+    return {"message": f"Job {job_id} queued for retry from stage {checkpoint.get('stage')}", "job_id": job_id,
+            "status_url": f"/jobs/{job_id}"}
+
+@app.api_route("/api/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def forward_request(path: str, request: Request):
+    # Forward the request to GitLab, streaming both bodies through the shared async connection pool
+    return await get_proxy().forward(request, path)
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await cache.run(cache.stats)}
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type="text/plain; version=0.0.4")
+
+def run_search(query, platform, page, per_page):
+    with Session() as session:
+        results, total = search_index.search(session, query, platform, limit=per_page, offset=(page - 1) * per_page)
+
+        search_results = [
+            {
+                "id": repo.id,
+                "name": repo.name,
+                "description": repo.description,
+                "path": repo.path,
+                "created_at": repo.created_at,
+                "default_branch": repo.default_branch,
+                "web_url": repo.web_url,
+                "ssh_url_to_repo": repo.ssh_url_to_repo,
+                "http_url_to_repo": repo.http_url_to_repo,
+                "last_activity_at": repo.last_activity_at,
+                "platform": repo.platform
+            }
+            for repo in results
+        ]
+        return {"search_results": search_results, "total": total, "page": page, "per_page": per_page}
 
 @app.get("/search-repositories")
-async def search_repositories(query: str):
+async def search_repositories(query: str, platform: Optional[str] = Query(None, alias="platform"), page: int = Query(1, ge=1, alias="page"), per_page: int = Query(20, ge=1, le=100, alias="per_page")):
     try:
-        with Session() as session:
-            results = session.query(Repository).filter(Repository.name.contains(query)).all()
-
-            search_results = [
-                {
-                    "name": repo.name,
-                    "description": repo.description,
-                    "path": repo.path,
-                    "created_at": repo.created_at,
-                    "default_branch": repo.default_branch,
-                    "web_url": repo.web_url,
-                    "ssh_url_to_repo": repo.ssh_url_to_repo,
-                    "http_url_to_repo": repo.http_url_to_repo,
-                    "last_activity_at": repo.last_activity_at,
-                    "platform": repo.platform
-                }
-                for repo in results
-            ]
-            return {"search_results": search_results}
+        # Queries run on the threadpool so a slow search never stalls other requests
+        return await run_in_threadpool(run_search, query, platform, page, per_page)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
 
-migrator = RepoMigrator()
\ No newline at end of file
+
+# Re-indexes configured platforms in the background: incremental cycles with a periodic full sweep,
+# in whichever worker holds the lock
+refresher = CatalogueRefresher(get_migrator(), indexer, leader=FileLock(lock_path("catalogue-refresh")))
\ No newline at end of file
@@ -1,44 +1,66 @@
-from azure.devops.connection import Connection
-from msrest.authentication import BasicAuthentication
-import requests
 import base64
+import os
+import logging
+
+from src.concurrency import ordered_map
+from src.http_client import get_http_client
+from src.ratelimit import get_rate_limiter
+
+logger = logging.getLogger(__name__)
 
 class Azure:
-    def __init__(self, organization, personal_access_token):
+    def __init__(self, organization, personal_access_token, http=None):
         self.organization = organization
-        self.base_url = f"https://dev.azure.com/{organization}"
+        self.base_url = f"{os.getenv('AZURE_DEVOPS_URL', 'https://dev.azure.com').rstrip('/')}/{organization}"
         self.auth_header = {
             'Authorization': 'Basic ' + base64.b64encode(f":{personal_access_token}".encode()).decode(),
             'Content-Type': 'application/json'
         }
+        self.http = http or get_http_client()
+        self.rate_limiter = get_rate_limiter("azure")
 
     def get_projects(self):
         url = f"{self.base_url}/_apis/projects?api-version=7.1-preview.4"
-        response = requests.get(url, headers=self.auth_header)
+        response = self.http.get(url, headers=self.auth_header, rate_limiter=self.rate_limiter)
         response.raise_for_status()
         return response.json()['value']
 
-    def get_all_repositories(self):
+    def get_all_repositories(self, project=None):
         all_repos = []
-        projects = self.get_projects()
-
-        for project in projects:
-            url = f"{self.base_url}/{project['id']}/_apis/git/repositories?api-version=7.1-preview.1"
-            print(url)
-            response = requests.get(url, headers=self.auth_header)
-            response.raise_for_status()
-            repos = response.json()['value']
-            all_repos.extend(repos)
-        
+        all_repos.extend(self.iter_repositories(project))
         return {"repositories": all_repos}
 
+    def iter_repositories(self, project=None):
+        projects = [{'id': project}] if project else self.get_projects()
+
+        # Projects are independent, so they are listed in parallel and yielded in project order
+        for repos in ordered_map(self.get_project_repositories, [project['id'] for project in projects]):
+            yield from repos
+
+    def iter_changed_repositories(self, since):
+        # Neither repositories nor projects carry a usable activity time (a project's lastUpdateTime does not
+        # move on pushes or new repositories), so every repository is listed and upserted; one call per project
+        yield from self.iter_repositories()
+
+    def get_project_repositories(self, project_id):
+        url = f"{self.base_url}/{project_id}/_apis/git/repositories?api-version=7.1-preview.1"
+        logger.debug("Fetching %s", url)
+        response = self.http.get(url, headers=self.auth_header, rate_limiter=self.rate_limiter)
+        response.raise_for_status()
+        return response.json()['value']
+
+    def get_repository(self, project, token, repo_name):
+        # Returns the remote URL of an existing repository, or None when it does not exist
+        url = f"{self.base_url}/{project}/_apis/git/repositories/{repo_name}?api-version=6.0"
+        response = self.http.get(url, headers=self.auth_header, rate_limiter=self.rate_limiter, cache=False)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()['remoteUrl']
+
     def create_repository(self, project, token, repo_name):
-        url = f"https://dev.azure.com/{self.organization}/{project}/_apis/git/repositories?api-version=6.0"
-        headers = {
-            'Authorization': f'Basic {token}',
-            'Content-Type': 'application/json'
-        }
+        url = f"{self.base_url}/{project}/_apis/git/repositories?api-version=6.0"
         data = {'name': repo_name}
-        response = requests.post(url, json=data, headers=headers)
+        response = self.http.post(url, json=data, headers=self.auth_header, rate_limiter=self.rate_limiter)
         response.raise_for_status()
         return response.json()['remoteUrl']
\ No newline at end of file
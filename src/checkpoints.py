@@ -0,0 +1,127 @@
+import json
+import time
+
+UNFINISHED_STATES = ("queued", "running")
+
+
+class Checkpoint:
+    # A migration's persisted progress; save() writes through so a crash loses at most the current stage
+    def __init__(self, store, job_id, data):
+        self.store = store
+        self.job_id = job_id
+        self.data = data
+
+    def get(self, field, default=None):
+        value = self.data.get(field)
+        return default if value is None else value
+
+    def save(self, **fields):
+        self.data.update(fields)
+        self.store.update(self.job_id, **fields)
+
+    def add_pushed_refs(self, refs):
+        pushed = sorted(set(self.get("pushed_refs", [])) | set(refs))
+        self.save(pushed_refs=pushed)
+
+
+class CheckpointStore:
+    # Stored as JSON text, with the value an empty column reads as
+    JSON_COLUMNS = {'pushed_refs': [], 'progress': None}
+
+    def __init__(self, session_factory, model):
+        self.session_factory = session_factory
+        self.model = model
+
+    def to_dict(self, row):
+        data = {column.name: getattr(row, column.name) for column in self.model.__table__.columns}
+        for column, empty in self.JSON_COLUMNS.items():
+            data[column] = json.loads(data[column]) if data[column] else empty
+        return data
+
+    def encode(self, fields):
+        return {name: json.dumps(value) if name in self.JSON_COLUMNS else value for name, value in fields.items()}
+
+    def create(self, job_id, **fields):
+        now = time.time()
+        with self.session_factory() as session:
+            with session.begin():
+                session.add(self.model(id=job_id, state="queued", stage="queued", attempts=0,
+                                       created_at=now, updated_at=now, heartbeat_at=now, **self.encode(fields)))
+        return self.load(job_id)
+
+    def load(self, job_id):
+        with self.session_factory() as session:
+            row = session.get(self.model, job_id)
+            return Checkpoint(self, job_id, self.to_dict(row)) if row is not None else None
+
+    def update(self, job_id, **fields):
+        with self.session_factory() as session:
+            with session.begin():
+                session.query(self.model).filter(self.model.id == job_id).update(
+                    {**self.encode(fields), "updated_at": time.time()}, synchronize_session=False)
+
+    def claim(self, job_id, owner, states, **fields):
+        # Compare-and-set on the state, so when several workers race for a migration exactly one wins
+        return self.take(owner, fields, self.model.id == job_id, self.model.state.in_(states))
+
+    def take_over(self, job_id, owner, previous_owner):
+        # Compare-and-set on the owner, for an unfinished migration whose worker has gone away
+        previous = self.model.owner == previous_owner if previous_owner else self.model.owner.is_(None)
+        return self.take(owner, {}, self.model.id == job_id, self.model.state.in_(UNFINISHED_STATES), previous)
+
+    def take(self, owner, fields, *conditions):
+        now = time.time()
+        with self.session_factory() as session:
+            with session.begin():
+                taken = session.query(self.model).filter(*conditions).update(
+                    {**self.encode(fields), "owner": owner, "heartbeat_at": now, "updated_at": now},
+                    synchronize_session=False)
+        return taken == 1
+
+    def heartbeat(self, owner, progress=None):
+        # Renews the lease on every unfinished migration the worker owns, and publishes the live progress
+        # of its running jobs so any worker can report it
+        now = time.time()
+        with self.session_factory() as session:
+            with session.begin():
+                for job_id, info in (progress or {}).items():
+                    session.query(self.model).filter(self.model.id == job_id, self.model.owner == owner).update(
+                        {"progress": json.dumps(info)}, synchronize_session=False)
+                session.query(self.model).filter(self.model.owner == owner,
+                                                 self.model.state.in_(UNFINISHED_STATES)).update(
+                    {"heartbeat_at": now}, synchronize_session=False)
+
+    def adopt(self, job_id, source_repo_url, target_platform, repo_name, project=None):
+        # The latest failed attempt at the same migration that got as far as creating the target, so the new
+        # job can reuse that repository instead of failing to create it again. Failed attempts are marked
+        # superseded by the new job, so none of them can be retried or adopted again; attempts still queued
+        # or running are never adopted
+        same = (self.model.source_repo_url == source_repo_url,
+                self.model.target_platform == target_platform.lower(),
+                self.model.repo_name == repo_name,
+                self.model.project == project)
+        superseded = {"state": "superseded", "error": f"Superseded by job {job_id}"}
+        while True:
+            with self.session_factory() as session:
+                row = (session.query(self.model)
+                       .filter(*same, self.model.target_repo_url.isnot(None), self.model.state == "failed")
+                       .order_by(self.model.updated_at.desc())
+                       .first())
+                if row is None:
+                    return None
+                adopted = self.to_dict(row)
+            # Compare-and-set, so a concurrent request or retry that got to the row first wins it
+            if self.claim(adopted["id"], adopted["owner"], ("failed",), **superseded):
+                break
+        with self.session_factory() as session:
+            with session.begin():
+                session.query(self.model).filter(*same, self.model.state == "failed").update(
+                    {**superseded, "updated_at": time.time()}, synchronize_session=False)
+        return adopted
+
+    def unfinished(self):
+        with self.session_factory() as session:
+            rows = (session.query(self.model)
+                    .filter(self.model.state.in_(UNFINISHED_STATES))
+                    .order_by(self.model.created_at))
+            return [self.to_dict(row) for row in rows]
@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+
+DONE = object()
+
+
+def listing_concurrency():
+    return int(os.getenv('LISTING_CONCURRENCY', 8))
+
+
+def ordered_map(func, items, max_workers=None):
+    # Like executor.map, but never runs more than max_workers calls ahead of the consumer,
+    # so results come back in input order while memory stays bounded
+    max_workers = max_workers or listing_concurrency()
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="listing") as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def ordered_chain(func, items, max_workers=None, buffer=2):
+    # func(item) returns an iterator of pages. Up to max_workers items are produced concurrently,
+    # each into a small bounded queue, and their pages are yielded item by item in input order
+    max_workers = max_workers or listing_concurrency()
+    closed = threading.Event()
+
+    def put(pages, page):
+        # Blocks while the consumer is behind, but gives up once the consumer has gone away
+        while not closed.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce(item, pages):
+        try:
+            if closed.is_set():
+                return
+            for page in func(item):
+                if not put(pages, page):
+                    return
+        finally:
+            put(pages, DONE)
+
+    def drain(pages, future):
+        while True:
+            page = pages.get()
+            if page is DONE:
+                break
+            yield page
+        future.result()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="listing") as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pages = Queue(maxsize=buffer)
+                pending.append((pages, executor.submit(produce, item, pages)))
+                if len(pending) >= max_workers:
+                    yield from drain(*pending.popleft())
+            while pending:
+                yield from drain(*pending.popleft())
+        finally:
+            closed.set()
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,54 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+
+def env_flag(name, default=False):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets searches read while an indexing run writes; NORMAL sync is safe in WAL mode and
+    # avoids an fsync per commit; busy_timeout makes concurrent writers wait instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))}")
+    cursor.execute(f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KIB', 65536))}")
+    cursor.execute(f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 ** 2))}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def make_engine(url=None, echo=None):
+    # DATABASE_URL takes any SQLAlchemy URL: the SQLite file by default, Postgres in production
+    url = url or os.getenv('DATABASE_URL', 'sqlite:///repositories.db')
+    echo = env_flag('DB_ECHO') if echo is None else echo
+    pool_size = int(os.getenv('DB_POOL_SIZE', 10))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', 20))
+
+    if url.startswith('sqlite'):
+        if url in ('sqlite://', 'sqlite:///:memory:'):
+            return create_engine(url, echo=echo)
+        # Pooled connections shared across the threadpool; each one is tuned once when it is opened
+        engine = create_engine(
+            url,
+            echo=echo,
+            poolclass=QueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        event.listen(engine, "connect", set_sqlite_pragmas)
+        return engine
+
+    return create_engine(
+        url,
+        echo=echo,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    )
+
@@ -1,48 +1,109 @@
-import requests
 import re
 import json
+import logging
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.concurrency import ordered_map
+from src.http_client import get_http_client
+from src.ratelimit import get_rate_limiter
+from src.timeutil import parse_timestamp
+
+logger = logging.getLogger(__name__)
 
 class GitHub:
-    def __init__(self, token):
-        self.base_url = "https://api.github.com"
+    def __init__(self, token, http=None):
+        self.base_url = os.getenv('GITHUB_API_URL', "https://api.github.com").rstrip('/')
         self.token = token
         self.headers = {"Authorization": f"token {token}"}
-        self.url = None  # URL will be set in get_all_repositories
+        self.http = http or get_http_client()
+        self.rate_limiter = get_rate_limiter("github")
 
 
     def get_all_repositories(self, organization, pagination=False, per_page=20, page=1):
         all_repositories = []
         all_links = []
-        self.url = f"{self.base_url}/orgs/{organization}/repos?per_page={per_page}&page={page}"
-        
+
         if pagination:  # Fetch only the first page with pagination links
-            response = requests.get(self.url, headers=self.headers)
-            print(response.headers)
+            url = f"{self.base_url}/orgs/{organization}/repos?per_page={per_page}&page={page}"
+            response = self.http.get(url, headers=self.headers, rate_limiter=self.rate_limiter)
             if response.status_code == 200:
                 all_repositories = response.json()
                 link_header = response.headers.get('link', None)
                 all_links = self.convert_links_to_json_array(link_header)
             else:
-                print(f"Failed to fetch repositories: {response.status_code}")
+                logger.warning("Failed to fetch repositories from %s: %s", url, response.status_code)
             return {"repositories": all_repositories, "headers": all_links}
 
         else:  # Fetch all repositories without pagination
-            while self.url:
-                response = requests.get(self.url, headers=self.headers)
-                print(response.headers)
-                if response.status_code == 200:
-                    repositories = response.json()
-                    if not repositories:
-                        break  # Exit the loop if no more repositories are returned
-
-                    all_repositories.extend(repositories)
-                    next_page_url = self.extract_next_page_url(response.headers.get('link', None))
-                    self.url = next_page_url
-                else:
-                    print(f"Failed to fetch repositories: {response.status_code}")
-                    break
+            all_repositories.extend(self.iter_repositories(organization, per_page, page))
             return {"repositories": all_repositories}
 
+    def iter_repositories(self, organization, per_page=20, page=1):
+        # Yields repositories page by page as they arrive, so callers can stream them without buffering the org.
+        # A page that still fails after retries raises, so a partial listing is never taken for the whole org
+        url = f"{self.base_url}/orgs/{organization}/repos?per_page={per_page}&page={page}"
+        response = self.get_listing(url)
+        yield from response.json()
+
+        link_header = response.headers.get('link', None)
+        last_page = self.extract_last_page(link_header)
+        if last_page:
+            # rel="last" tells us how many pages there are, so the rest can be fetched in parallel
+            page_urls = [self.page_url(url, number) for number in range(page + 1, last_page + 1)]
+            for repositories in ordered_map(self.get_page, page_urls):
+                yield from repositories
+        else:
+            url = self.extract_next_page_url(link_header)
+            while url:
+                response = self.get_listing(url)
+                repositories = response.json()
+                if not repositories:
+                    break  # Exit the loop if no more repositories are returned
+                yield from repositories
+                url = self.extract_next_page_url(response.headers.get('link', None))
+
+    def iter_updated_repositories(self, organization, since, per_page=100):
+        # Most recently updated first, so paging stops at the first page that reaches back past `since`
+        url = f"{self.base_url}/orgs/{organization}/repos?sort=updated&direction=desc&per_page={per_page}"
+        while url:
+            response = self.get_listing(url)
+            repositories = response.json()
+            for repo in repositories:
+                changed = [parse_timestamp(repo.get(field)) for field in ('updated_at', 'pushed_at')]
+                if max((moment for moment in changed if moment), default=since) >= since:
+                    yield repo
+            oldest = parse_timestamp(repositories[-1].get('updated_at')) if repositories else None
+            if oldest is None or oldest < since:
+                return
+            url = self.extract_next_page_url(response.headers.get('link', None))
+
+    def get_page(self, url):
+        return self.get_listing(url).json()
+
+    def get_listing(self, url):
+        response = self.http.get(url, headers=self.headers, rate_limiter=self.rate_limiter)
+        if response.status_code != 200:
+            logger.warning("Failed to fetch repositories from %s: %s", url, response.status_code)
+            response.raise_for_status()
+            raise Exception(f"Failed to fetch repositories from {url}: {response.status_code}")
+        return response
+
+    def page_url(self, url, page):
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query['page'] = str(page)
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def extract_last_page(self, link_header):
+        if link_header:
+            for link in link_header.split(','):
+                if 'rel="last"' in link:
+                    last_page_url = link.split(';')[0].strip('<> ')
+                    page = dict(parse_qsl(urlsplit(last_page_url).query)).get('page')
+                    return int(page) if page and page.isdigit() else None
+        return None
+
     def extract_next_page_url(self, link_header):
         if link_header:
             links = link_header.split(',')
@@ -52,8 +113,21 @@ class GitHub:
                     return next_page_url
         return None
 
+    def get_repository(self, repo_name, token, organization="TEL-CO"):
+        # Returns the clone URL of an existing repository, or None when it does not exist
+        url = f"{self.base_url}/repos/{organization}/{repo_name}"
+        headers = {
+            'Authorization': f'token {token}',
+            'Accept': 'application/vnd.github.v3+json'
+        }
+        response = self.http.get(url, headers=headers, rate_limiter=self.rate_limiter, cache=False)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()['clone_url']
+
     def create_repository(self, repo_name, token, organization="TEL-CO"):
-        url = f"https://api.github.com/orgs/{organization}/repos" if organization else "https://api.github.com/user/repos"
+        url = f"{self.base_url}/orgs/{organization}/repos" if organization else f"{self.base_url}/user/repos"
         headers = {
             'Authorization': f'token {token}',
             'Accept': 'application/vnd.github.v3+json'
@@ -62,17 +136,21 @@ class GitHub:
             'name': repo_name,
             'private': True  # Set to True if you want to create a private repository
         }
-        response = requests.post(url, json=data, headers=headers)
+        response = self.http.post(url, json=data, headers=headers, rate_limiter=self.rate_limiter)
         response.raise_for_status()
         return response.json()['clone_url']
         
+    def replace_domain(self, url):
+        # GitHub pagination links are returned unchanged
+        return url
+
     def convert_links_to_json_array(self, link_header):
         # Pattern to find URLs and their relational tags
         # link_header = self.rewrite_urls_to_localhost(link_header)
         url_pattern = re.compile(r'<(https?://[^>]+)>; rel="([^"]+)"')
 
         # Find all URLs and their relational tags
-        urls = url_pattern.findall(link_header)
+        urls = url_pattern.findall(link_header or '')
 
         # Construct a list of dictionaries
         json_array = [{"url": self.replace_domain(url), "rel": rel} for url, rel in urls]
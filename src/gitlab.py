@@ -1,68 +1,159 @@
-import requests
 import re
 import json
+import logging
+import os
+import time
+from functools import partial
+
+from src.concurrency import ordered_chain, ordered_map
+from src.http_client import get_http_client
+from src.ratelimit import get_rate_limiter
+from src.timeutil import isoformat
+
+logger = logging.getLogger(__name__)
 
 class GitLab:
-    def __init__(self, token):
-        self.base_url = "https://gitlab.com/api/v4"
+    def __init__(self, token, http=None):
+        self.base_url = os.getenv('GITLAB_API_URL', "https://gitlab.com/api/v4").rstrip('/')
         self.headers = {"Authorization": f"Bearer {token}"}
-        self.url = None
-        self.pagination = None
+        self.http = http or get_http_client()
+        self.rate_limiter = get_rate_limiter("gitlab")
 
-    def get_all_repositories(self, group_id, pagination=False, per_page=20, order_by='id', sort='asc'):
+    def get_all_repositories(self, group_id, pagination=False, per_page=20, order_by='id', sort='asc',
+                             include_subgroups=False):
         all_repositories = []
         all_links = []
         last_repository_id = 0
 
-        groups_to_process = [group_id] + [subgroup['id'] for subgroup in self.get_subgroups(group_id)]
-        for group in groups_to_process:
-            last_repository_id = 0
-            if pagination is True:  # Fetch only the first page with pagination links
-                self.url = (f"{self.base_url}/groups/{group}/projects?per_page={per_page}"
-                            f"&order_by={order_by}&sort={sort}&id_after={last_repository_id}")
-
-                response = requests.get(self.url, headers=self.headers)
-                if response.status_code == 200:
-                    repositories = response.json()
-                    all_repositories.extend(repositories)
-                    link_header = response.headers.get('link', None)
-                    all_links = self.convert_links_to_json_array(link_header)
-                else:
-                    print(f"Failed to fetch repositories: {response.status_code}")
-                return {"repositories": all_repositories, "headers": all_links}
-
-            else:  # Fetch all repositories without pagination
-                while True:
-                    self.url = (f"{self.base_url}/groups/{group}/projects?per_page={per_page}"
-                                f"&order_by={order_by}&sort={sort}&id_after={last_repository_id}")
-                    print(self.url)
-                    response = requests.get(self.url, headers=self.headers)
-                    if response.status_code == 200:
-                        repositories = response.json()
-                        if not repositories:
-                            break  # Exit the loop if no more repositories are returned
-
-                        all_repositories.extend(repositories)
-                        last_repository_id = repositories[-1]['id']
-                    else:
-                        print(f"Failed to fetch repositories: {response.status_code}")
-                        break
+        if pagination is True:  # Fetch only the first page with pagination links
+            url = (f"{self.base_url}/groups/{group_id}/projects?per_page={per_page}"
+                   f"&order_by={order_by}&sort={sort}&id_after={last_repository_id}")
+            if include_subgroups:
+                url += "&include_subgroups=true"
+
+            response = self.http.get(url, headers=self.headers, rate_limiter=self.rate_limiter)
+            if response.status_code == 200:
+                repositories = response.json()
+                all_repositories.extend(repositories)
+                link_header = response.headers.get('link', None)
+                all_links = self.convert_links_to_json_array(link_header)
+            else:
+                logger.warning("Failed to fetch repositories from %s: %s", url, response.status_code)
+            return {"repositories": all_repositories, "headers": all_links}
 
+        # Fetch all repositories without pagination
+        all_repositories.extend(self.iter_repositories(group_id, per_page, order_by, sort, include_subgroups))
         return {"repositories": all_repositories}
-    
-    #@todo make it recursive
+
+    def iter_repositories(self, group_id, per_page=20, order_by='id', sort='asc', include_subgroups=False):
+        if include_subgroups:
+            # GitLab walks the whole hierarchy server-side and returns one paginated stream
+            for repositories in self.iter_group_pages(group_id, per_page, order_by, sort, include_subgroups=True):
+                yield from repositories
+            return
+
+        # id_after paging is sequential within a group, so the groups themselves are walked in parallel.
+        # Pages are yielded group by group in order as they arrive, with only a few pages buffered per group
+        groups_to_process = [group_id] + [subgroup['id'] for subgroup in self.get_subgroups(group_id)]
+        fetch_group = partial(self.iter_group_pages, per_page=per_page, order_by=order_by, sort=sort)
+        for repositories in ordered_chain(fetch_group, groups_to_process):
+            yield from repositories
+
+    def iter_changed_repositories(self, group_id, since, per_page=100):
+        # Only projects with activity after `since`, filtered server-side across the whole hierarchy
+        for repositories in self.iter_group_pages(group_id, per_page, include_subgroups=True,
+                                                  last_activity_after=isoformat(since)):
+            yield from repositories
+
+    def iter_group_pages(self, group, per_page=20, order_by='id', sort='asc', include_subgroups=False,
+                         last_activity_after=None):
+        last_repository_id = 0
+        while True:
+            url = (f"{self.base_url}/groups/{group}/projects?per_page={per_page}"
+                   f"&order_by={order_by}&sort={sort}&id_after={last_repository_id}")
+            if include_subgroups:
+                url += "&include_subgroups=true"
+            if last_activity_after:
+                url += f"&last_activity_after={last_activity_after}"
+            logger.debug("Fetching %s", url)
+            response = self.http.get(url, headers=self.headers, rate_limiter=self.rate_limiter)
+            if response.status_code == 200:
+                page = response.json()
+                if not page:
+                    break  # Exit the loop if no more repositories are returned
+
+                yield page
+                last_repository_id = page[-1]['id']
+            else:
+                # Raised rather than ending the listing early, so a partial listing is never indexed as complete
+                logger.warning("Failed to fetch repositories from %s: %s", url, response.status_code)
+                response.raise_for_status()
+                raise Exception(f"Failed to fetch repositories from {url}: {response.status_code}")
+
     def get_subgroups(self, group_id):
+        # All descendant groups, not only the direct children
+        subgroups, _ = self.walk_subgroups(group_id)
+        return subgroups
+
+    def walk_subgroups(self, group_id):
+        # Breadth-first walk: every group on a level is expanded concurrently before moving one level down.
+        # Groups are de-duplicated by id, and each expansion is timed for the report
+        started = time.monotonic()
+        seen = {str(group_id)}
+        subgroups = []
+        report = {"group_id": group_id, "levels": [], "groups": []}
+        level = [group_id]
+        depth = 0
+
+        while level:
+            depth += 1
+            level_started = time.monotonic()
+            next_level = []
+            for parent_id, (children, pages, seconds) in zip(level, ordered_map(self.get_direct_subgroups, level)):
+                report["groups"].append({
+                    "id": parent_id,
+                    "depth": depth - 1,
+                    "subgroups": len(children),
+                    "pages": pages,
+                    "seconds": round(seconds, 3),
+                })
+                for child in children:
+                    if str(child['id']) in seen:
+                        continue
+                    seen.add(str(child['id']))
+                    child['depth'] = depth
+                    subgroups.append(child)
+                    next_level.append(child['id'])
+            report["levels"].append({
+                "depth": depth,
+                "parents": len(level),
+                "groups_found": len(next_level),
+                "seconds": round(time.monotonic() - level_started, 3),
+            })
+            level = next_level
+
+        report["total_groups"] = len(subgroups)
+        report["max_depth"] = max((subgroup['depth'] for subgroup in subgroups), default=0)
+        report["seconds"] = round(time.monotonic() - started, 3)
+        return subgroups, report
+
+    def get_direct_subgroups(self, group_id):
+        started = time.monotonic()
         subgroups = []
+        pages = 0
         url = f"{self.base_url}/groups/{group_id}/subgroups?per_page=100"  # Adjust per_page as needed
         while url:
-            response = requests.get(url, headers=self.headers)
+            response = self.http.get(url, headers=self.headers, rate_limiter=self.rate_limiter)
             if response.status_code == 200:
+                pages += 1
                 subgroups.extend(response.json())
                 url = self.extract_next_page_url(response.headers.get('link', None))
             else:
-                print(f"Failed to fetch subgroups: {response.status_code}")
-                break
-        return subgroups
+                # A missing subgroup would drop all of its projects from the listing
+                logger.warning("Failed to fetch subgroups from %s: %s", url, response.status_code)
+                response.raise_for_status()
+                raise Exception(f"Failed to fetch subgroups from {url}: {response.status_code}")
+        return subgroups, pages, time.monotonic() - started
     
     def extract_next_page_url(self, link_header):
         if link_header:
@@ -93,22 +184,39 @@ class GitLab:
 
     def proxy_request(self, method, path, headers, data):
         # Construct the new URL for GitLab
-        new_url = f"https://gitlab.com/api/v4/{path}"
+        new_url = f"{self.base_url}/{path}"
 
         # Forward the request to GitLab
         method = method.lower()
         headers = {key: value for key, value in headers.items() if key.lower() != 'host'}
 
         # Make the request to GitLab
-        response = requests.request(method, new_url, headers=headers, data=data, allow_redirects=False)
+        response = self.http.request(method, new_url, headers=headers, data=data, allow_redirects=False,
+                                     rate_limiter=self.rate_limiter)
         return response
     
+    def get_repository(self, repo_name, token):
+        # Returns the clone URL of an existing project owned by the token, or None when it does not exist
+        url = f"{self.base_url}/projects"
+        headers = {
+            'Authorization': f'Bearer {token}'
+        }
+        params = {'search': repo_name, 'owned': 'true', 'simple': 'true'}
+        # Never served from the response cache: a cached miss would have sync mode create the project twice
+        response = self.http.get(url, params=params, headers=headers, rate_limiter=self.rate_limiter,
+                                 cache=False)
+        response.raise_for_status()
+        for project in response.json():
+            if repo_name in (project.get('name'), project.get('path')):
+                return project['http_url_to_repo']
+        return None
+
     def create_repository(self, repo_name, token):
-        url = "https://gitlab.com/api/v4/projects"
+        url = f"{self.base_url}/projects"
         headers = {
             'Authorization': f'Bearer {token}'
         }
         data = {'name': repo_name}
-        response = requests.post(url, data=data, headers=headers)
+        response = self.http.post(url, data=data, headers=headers, rate_limiter=self.rate_limiter)
         response.raise_for_status()
         return response.json()['http_url_to_repo']
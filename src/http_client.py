@@ -0,0 +1,231 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from src.metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+from src.ratelimit import parse_retry_after
+from src.response_cache import get_response_cache
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# requests has already decoded the body, so these no longer describe what is stored
+DECODED_BODY_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class RetryPolicy:
+    def __init__(self, retries=None, backoff=None, max_backoff=None):
+        self.retries = retries if retries is not None else int(os.getenv('HTTP_RETRIES', 3))
+        self.backoff = backoff if backoff is not None else float(os.getenv('HTTP_BACKOFF', 0.5))
+        self.max_backoff = max_backoff if max_backoff is not None else float(os.getenv('HTTP_MAX_BACKOFF', 60))
+
+    def should_retry(self, method, status_code, attempt):
+        if attempt >= self.retries or status_code not in RETRY_STATUSES:
+            return False
+        # Non-idempotent requests (creating a repository) are only replayed when the server refused them outright
+        return method.upper() in IDEMPOTENT_METHODS or status_code == 429
+
+    def delay(self, attempt, headers=None):
+        retry_after = (headers or {}).get('retry-after') or (headers or {}).get('Retry-After')
+        if retry_after:
+            return min(parse_retry_after(retry_after), self.max_backoff)
+        # Exponential backoff with full jitter so parallel workers do not retry in lockstep
+        return random.uniform(0, min(self.backoff * (2 ** attempt), self.max_backoff))
+
+
+class HttpClient:
+    def __init__(self, connect_timeout=None, read_timeout=None, pool_size=None, retry_policy=None, cache=None):
+        self.cache = cache if cache is not None else get_response_cache()
+        self.timeout = (
+            connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', 5)),
+            read_timeout or float(os.getenv('HTTP_READ_TIMEOUT', 30)),
+        )
+        self.pool_size = pool_size or int(os.getenv('HTTP_POOL_SIZE', 20))
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, url):
+        # One keep-alive session per host, so handshakes are paid once per connection rather than per page
+        host = urlsplit(url).netloc
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def request(self, method, url, rate_limiter=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        session = self.session(url)
+        platform = rate_limiter.platform if rate_limiter else "other"
+        attempt = 0
+        while True:
+            if rate_limiter:
+                rate_limiter.wait()
+            try:
+                with UPSTREAM_SECONDS.time(platform=platform, method=method.upper()):
+                    response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                UPSTREAM_REQUESTS.inc(platform=platform, status="error")
+                if attempt >= self.retry_policy.retries or method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                time.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+                continue
+
+            UPSTREAM_REQUESTS.inc(platform=platform, status=response.status_code)
+            if rate_limiter:
+                rate_limiter.update(response.headers)
+            if not self.retry_policy.should_retry(method, response.status_code, attempt):
+                return response
+            time.sleep(self.retry_policy.delay(attempt, response.headers))
+            attempt += 1
+
+    def get(self, url, cache=True, **kwargs):
+        if not (cache and self.cache):
+            return self.request("GET", url, **kwargs)
+
+        # Fresh entries are served locally; stale ones are revalidated with If-None-Match,
+        # and a 304 (which GitHub does not count against the rate limit) reuses the cached body
+        key = self.cache.key("GET", self.full_url(url, kwargs.get('params')), kwargs.get('headers'))
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh():
+            return self.cached_response(url, entry)
+        if entry is not None and entry.etag:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), 'If-None-Match': entry.etag}
+
+        response = self.request("GET", url, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidated(key)
+            return self.cached_response(url, entry)
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DECODED_BODY_HEADERS}
+        self.cache.store(key, response.status_code, headers, response.content)
+        return response
+
+    def full_url(self, url, params=None):
+        return requests.Request("GET", url, params=params).prepare().url if params else url
+
+    def cached_response(self, url, entry):
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response._content = entry.body
+        response.url = url
+        response.encoding = 'utf-8'
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+
+class AsyncHttpClient:
+    def __init__(self, connect_timeout=None, read_timeout=None, max_connections=None, retry_policy=None):
+        self.connect_timeout = connect_timeout or float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+        self.read_timeout = read_timeout or float(os.getenv('HTTP_READ_TIMEOUT', 30))
+        self.max_connections = max_connections or int(os.getenv('HTTP_POOL_SIZE', 20))
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.client = None
+
+    def get_client(self):
+        # httpx is only needed by the async handlers, so it is imported on first use
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self.client
+
+    async def request(self, method, url, rate_limiter=None, **kwargs):
+        import httpx
+        client = self.get_client()
+        platform = rate_limiter.platform if rate_limiter else "other"
+        attempt = 0
+        while True:
+            if rate_limiter:
+                delay = rate_limiter.pause_until - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                with UPSTREAM_SECONDS.time(platform=platform, method=method.upper()):
+                    response = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.TimeoutException):
+                UPSTREAM_REQUESTS.inc(platform=platform, status="error")
+                if attempt >= self.retry_policy.retries or method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+                attempt += 1
+                continue
+
+            UPSTREAM_REQUESTS.inc(platform=platform, status=response.status_code)
+            if rate_limiter:
+                rate_limiter.update(response.headers)
+            if not self.retry_policy.should_retry(method, response.status_code, attempt):
+                return response
+            await response.aclose()
+            await asyncio.sleep(self.retry_policy.delay(attempt, response.headers))
+            attempt += 1
+
+    async def stream(self, method, url, **kwargs):
+        # Sends the request and returns as soon as the headers arrive; the caller reads the body
+        # with aiter_raw() and must aclose() the response. Streamed bodies can only be sent once, so no retries
+        client = self.get_client()
+        request = client.build_request(method, url, **kwargs)
+        return await client.send(request, stream=True)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+shared_client = None
+shared_async_client = None
+shared_lock = threading.Lock()
+
+
+def get_http_client():
+    global shared_client
+    with shared_lock:
+        if shared_client is None:
+            shared_client = HttpClient()
+        return shared_client
+
+
+async def close_http_clients():
+    # Closes the shared clients that were created, without creating the others
+    if shared_client is not None:
+        shared_client.close()
+    if shared_async_client is not None:
+        await shared_async_client.close()
+
+
+def get_async_http_client():
+    global shared_async_client
+    with shared_lock:
+        if shared_async_client is None:
+            shared_async_client = AsyncHttpClient()
+        return shared_async_client
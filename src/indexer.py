@@ -0,0 +1,113 @@
+import importlib
+import os
+import time
+from datetime import datetime, timezone
+
+from src.metrics import INDEXED_REPOSITORIES, span
+
+
+class Indexer:
+    # Columns refreshed on every upsert; id and the (platform, external_id) key never change
+    UPDATED_COLUMNS = (
+        'name', 'description', 'path', 'created_at', 'default_branch', 'web_url',
+        'ssh_url_to_repo', 'http_url_to_repo', 'last_activity_at', 'last_indexed_at',
+    )
+
+    def __init__(self, session_factory, model, chunk_size=None):
+        self.session_factory = session_factory
+        self.model = model
+        self.chunk_size = chunk_size or int(os.getenv('INDEX_CHUNK_SIZE', 500))
+
+    def normalize(self, platform, repo):
+        platform = platform.lower()
+        if platform == "github":
+            return {
+                "external_id": str(repo.get('id')),
+                "name": repo.get('name'),
+                "description": repo.get('description'),
+                "path": repo.get('full_name'),
+                "created_at": repo.get('created_at'),
+                "default_branch": repo.get('default_branch'),
+                "web_url": repo.get('html_url'),
+                "ssh_url_to_repo": repo.get('ssh_url'),
+                "http_url_to_repo": repo.get('clone_url'),
+                "last_activity_at": repo.get('pushed_at') or repo.get('updated_at'),
+            }
+        elif platform == "azure":
+            project = repo.get('project') or {}
+            default_branch = repo.get('defaultBranch') or ''
+            return {
+                "external_id": str(repo.get('id')),
+                "name": repo.get('name'),
+                "description": project.get('description'),
+                "path": f"{project['name']}/{repo.get('name')}" if project.get('name') else repo.get('name'),
+                "created_at": None,
+                "default_branch": default_branch.replace('refs/heads/', '', 1) or None,
+                "web_url": repo.get('webUrl'),
+                "ssh_url_to_repo": repo.get('sshUrl'),
+                "http_url_to_repo": repo.get('remoteUrl'),
+                "last_activity_at": project.get('lastUpdateTime'),
+            }
+        return {
+            "external_id": str(repo.get('id')),
+            "name": repo.get('name'),
+            "description": repo.get('description'),
+            "path": repo.get('path_with_namespace') or repo.get('path'),
+            "created_at": repo.get('created_at'),
+            "default_branch": repo.get('default_branch'),
+            "web_url": repo.get('web_url'),
+            "ssh_url_to_repo": repo.get('ssh_url_to_repo'),
+            "http_url_to_repo": repo.get('http_url_to_repo'),
+            "last_activity_at": repo.get('last_activity_at'),
+        }
+
+    def index(self, platform, repositories, prune=True):
+        # Upserts keyed on (platform, external_id) in chunks, all in one transaction.
+        # With prune, rows this run did not touch are repositories that disappeared upstream
+        started = time.monotonic()
+        platform = platform.lower()
+        indexed_at = datetime.now(timezone.utc).isoformat()
+        upserted = 0
+        deleted = 0
+
+        with span("index", platform), self.session_factory() as session:
+            with session.begin():
+                chunk = {}
+                for repo in repositories:
+                    row = self.normalize(platform, repo)
+                    row.update({"platform": platform, "last_indexed_at": indexed_at})
+                    chunk[row["external_id"]] = row
+                    if len(chunk) >= self.chunk_size:
+                        upserted += self.upsert(session, list(chunk.values()))
+                        chunk = {}
+                if chunk:
+                    upserted += self.upsert(session, list(chunk.values()))
+
+                if prune:
+                    deleted = (session.query(self.model)
+                               .filter(self.model.platform == platform,
+                                       self.model.last_indexed_at < indexed_at)
+                               .delete(synchronize_session=False))
+
+        INDEXED_REPOSITORIES.inc(upserted, platform=platform)
+        return {
+            "platform": platform,
+            "upserted": upserted,
+            "deleted": deleted,
+            "indexed_at": indexed_at,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def upsert(self, session, rows):
+        # One prepared INSERT ... ON CONFLICT DO UPDATE run with executemany for the whole chunk.
+        # SQLite and Postgres share the syntax, but each dialect has its own insert construct
+        # Only the dialect in use is imported
+        name = "postgresql" if session.get_bind().dialect.name == "postgresql" else "sqlite"
+        dialect = importlib.import_module(f"sqlalchemy.dialects.{name}")
+        statement = dialect.insert(self.model.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['platform', 'external_id'],
+            set_={column: statement.excluded[column] for column in self.UPDATED_COLUMNS}
+        )
+        session.execute(statement, rows)
+        return len(rows)
@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, kind, params=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.state = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.future = None
+
+    def report(self, stage, **info):
+        # Called from the worker thread; the latest stage and counters are exposed on GET /jobs/{id}
+        self.progress = {"stage": stage, **info, "updated_at": time.time()}
+
+    def to_dict(self):
+        queued_for = (self.started_at or time.time()) - self.created_at
+        duration = None
+        if self.started_at:
+            duration = (self.finished_at or time.time()) - self.started_at
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queued_seconds": round(queued_for, 3),
+            "duration_seconds": round(duration, 3) if duration is not None else None,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(self, max_workers=None, history=None):
+        self.max_workers = max_workers or int(os.getenv('MIGRATION_WORKERS', 4))
+        self.history = history or int(os.getenv('MIGRATION_JOB_HISTORY', 1000))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="migration")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, kind, func, *args, params=None, with_progress=False, job_id=None, **kwargs):
+        job = Job(kind, params, job_id)
+        if with_progress:
+            kwargs['progress'] = job.report
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        job.future = self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def progress(self):
+        # Latest progress of every running job, keyed by job id
+        with self.lock:
+            return {job.id: job.progress for job in self.jobs.values() if job.state == "running" and job.progress}
+
+    def stats(self):
+        counts = {"queued": 0, "running": 0, "succeeded": 0, "failed": 0}
+        with self.lock:
+            for job in self.jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+        return counts
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait)
+
+    def _run(self, job, func, args, kwargs):
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            job.result = func(*args, **kwargs)
+            job.state = "succeeded"
+        except Exception as e:
+            logger.warning("Job %s (%s) failed: %s", job.id, job.kind, e)
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        # Drop the oldest finished jobs once the history limit is reached
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in ("succeeded", "failed")]
+        excess = len(self.jobs) - self.history
+        for job_id in finished[:max(excess, 0)]:
+            del self.jobs[job_id]
@@ -0,0 +1,78 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id():
+    # Host and pid locate the process; the random suffix tells a restarted process apart from its
+    # predecessor when it gets the same pid, as it usually does in a container
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class MigrationLeases:
+    # Shares migrations between worker processes through the checkpoint table. A worker owns the
+    # migrations it queued and renews their lease every `interval` seconds. Migrations whose owner
+    # exited (on this host) or stopped renewing for `lease` seconds are claimed by exactly one
+    # other worker and resumed from their checkpoint
+    def __init__(self, checkpoints, job_queue, submit, interval=None, lease=None):
+        self.checkpoints = checkpoints
+        self.job_queue = job_queue
+        self.submit = submit
+        self.lease = lease or float(os.getenv('MIGRATION_LEASE_SECONDS', 120))
+        self.interval = interval or float(os.getenv('MIGRATION_HEARTBEAT_SECONDS', self.lease / 4))
+        self.owner = worker_id()
+        self.hostname = socket.gethostname()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, name="migration-leases", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        # Reclaiming first means a restarted service resumes its migrations straight away
+        while not self.stopped.is_set():
+            try:
+                self.reclaim()
+                self.checkpoints.heartbeat(self.owner, self.job_queue.progress())
+            except Exception as e:
+                logger.warning("Migration lease renewal failed: %s", e)
+            self.stopped.wait(self.interval)
+
+    def reclaim(self):
+        claimed = []
+        for checkpoint in self.checkpoints.unfinished():
+            if checkpoint["owner"] == self.owner or not self.abandoned(checkpoint):
+                continue
+            if self.checkpoints.take_over(checkpoint["id"], self.owner, checkpoint["owner"]):
+                logger.info("Resuming migration %s of %s from stage %s (owner was %s)", checkpoint["id"],
+                            checkpoint["repo_name"], checkpoint["stage"], checkpoint["owner"])
+                self.submit(checkpoint)
+                claimed.append(checkpoint["id"])
+        return claimed
+
+    def abandoned(self, checkpoint):
+        if not checkpoint["owner"] or (checkpoint["heartbeat_at"] or 0) < time.time() - self.lease:
+            return True
+        host, pid, _ = checkpoint["owner"].rsplit(":", 2)
+        if host != self.hostname:
+            return False
+        if int(pid) == os.getpid():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
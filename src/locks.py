@@ -0,0 +1,54 @@
+import fcntl
+import os
+import tempfile
+
+LOCK_DIR = os.getenv('LOCK_DIR', os.path.join(tempfile.gettempdir(), "repo-migrator-locks"))
+
+
+def lock_path(name):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    return os.path.join(LOCK_DIR, f"{name}.lock")
+
+
+class FileLock:
+    # An exclusive flock on a file, shared by every thread and worker process on the host. Each holder
+    # opens its own descriptor, so threads of one process exclude each other too, and the OS drops
+    # the lock when the holder exits, even on a crash
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+        # The holder's pid, for humans looking at the lock file
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        return True
+
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    @property
+    def held(self):
+        return self.fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; wide enough for both API calls and multi-hour pushes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        # Collectors refresh gauges that are cheaper to read at scrape time (queue depth, cache size)
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self):
+        with self.lock:
+            collectors = list(self.collectors)
+            metrics = list(self.metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        return "".join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, self.format_labels(key), value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", self.format_labels(key, [("le", bound)]), bucket_count))
+                samples.append((f"{self.name}_bucket", self.format_labels(key, [("le", "+Inf")]), count))
+                samples.append((f"{self.name}_sum", self.format_labels(key), round(total, 6)))
+                samples.append((f"{self.name}_count", self.format_labels(key), count))
+        return samples
+
+
+STAGE_SECONDS = Histogram(
+    "migrator_stage_seconds", "Time spent in each stage of a migration or indexing run", ("stage", "platform"))
+STAGE_FAILURES = Counter(
+    "migrator_stage_failures_total", "Stages that ended with an error", ("stage", "platform"))
+UPSTREAM_SECONDS = Histogram(
+    "migrator_upstream_request_seconds", "Latency of calls to the platform APIs", ("platform", "method"))
+UPSTREAM_REQUESTS = Counter(
+    "migrator_upstream_requests_total", "Calls to the platform APIs by response status", ("platform", "status"))
+RATE_LIMIT_REMAINING = Gauge(
+    "migrator_rate_limit_remaining", "Requests left in the current rate-limit window", ("platform",))
+TRANSFER_BYTES = Counter(
+    "migrator_git_transfer_bytes_total", "Bytes received by git fetch/clone and sent by git push", ("direction",))
+JOBS = Gauge("migrator_jobs", "Migration jobs by state", ("state",))
+RESPONSE_CACHE = Gauge("migrator_response_cache", "Upstream response cache counters and size", ("stat",))
+INDEXED_REPOSITORIES = Counter(
+    "migrator_indexed_repositories_total", "Repositories upserted into the catalogue", ("platform",))
+
+
+@contextmanager
+def span(stage, platform=None):
+    # Times one stage into STAGE_SECONDS and logs it, so slow stages show up both in /metrics and in the logs
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.inc(stage=stage, platform=platform or "")
+        raise
+    finally:
+        elapsed = time.monotonic() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage, platform=platform or "")
+        logger.debug("%s%s took %.3fs", stage, f" ({platform})" if platform else "", elapsed)
+
+
+def render():
+    return REGISTRY.render()
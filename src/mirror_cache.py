@@ -0,0 +1,134 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from git import Git, Repo, GitCommandError, InvalidGitRepositoryError, NoSuchPathError
+
+from src.locks import FileLock
+from src.metrics import span
+from src.transfer import directory_size, run_with_progress
+
+
+class MirrorCache:
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv('MIRROR_CACHE_DIR', os.path.join(tempfile.gettempdir(), "mirror-cache"))
+        self.max_bytes = max_bytes or int(os.getenv('MIRROR_CACHE_MAX_BYTES', 20 * 1024 ** 3))
+        self.in_use = Counter()
+        self.guard = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, source_url, clone_filter=None):
+        # Partial (filtered) mirrors hold different objects, so they never share an entry with full ones
+        identity = f"{source_url}#filter={clone_filter}" if clone_filter else source_url
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def path(self, source_url, clone_filter=None):
+        return os.path.join(self.root, f"{self.key(source_url, clone_filter)}.git")
+
+    def lock(self, key):
+        # A file lock rather than a thread lock, so worker processes sharing MIRROR_CACHE_DIR take turns too
+        return FileLock(os.path.join(self.root, f"{key}.lock"))
+
+    @contextmanager
+    def checkout(self, source_url, clone_filter=None):
+        # One job at a time per source mirror; other sources proceed in parallel
+        key = self.key(source_url, clone_filter)
+        with self.guard:
+            self.in_use[key] += 1
+        try:
+            with self.lock(key):
+                yield self.path(source_url, clone_filter)
+        finally:
+            with self.guard:
+                self.in_use[key] -= 1
+                if not self.in_use[key]:
+                    del self.in_use[key]
+            with span("cleanup"):
+                self.evict()
+
+    def update(self, source_url, clone_filter=None, progress=None):
+        # Fetch only the delta into an existing mirror, or create it on first use
+        progress = progress or (lambda stage, **info: None)
+        path = self.path(source_url, clone_filter)
+        if os.path.isdir(path):
+            repo = self.open(path)
+            if repo is not None:
+                # A failed fetch (source unreachable, bad credentials) raises and keeps the mirror for next time
+                run_with_progress(repo.git, "fetch", progress, 'fetch', '--prune', 'origin')
+                os.utime(path)
+                return repo
+            # A broken mirror is cheaper to rebuild than to repair
+            shutil.rmtree(path, ignore_errors=True)
+
+        staging = f"{path}.partial"
+        shutil.rmtree(staging, ignore_errors=True)
+        args = ['--mirror', f'--filter={clone_filter}'] if clone_filter else ['--mirror']
+        try:
+            run_with_progress(Git(), "clone", progress, 'clone', *args, source_url, staging)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        os.rename(staging, path)
+        return Repo(path)
+
+    def open(self, path):
+        # The mirror, or None when it is corrupt: not a repository any more, or HEAD no longer resolves
+        try:
+            repo = Repo(path)
+            repo.git.rev_parse('--verify', '--quiet', 'HEAD^{commit}')
+            return repo
+        except (InvalidGitRepositoryError, NoSuchPathError, GitCommandError):
+            return None
+
+    def size(self, path):
+        return directory_size(path)
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".git") and os.path.isdir(path):
+                entries.append({
+                    "key": name[:-len(".git")],
+                    "path": path,
+                    "last_used": os.path.getmtime(path),
+                    "size": self.size(path),
+                })
+        return entries
+
+    def evict(self):
+        # Least recently used mirrors go first. Mirrors held by any job, or awaited by one in this process,
+        # are never removed. A job in another worker that is still waiting for the lock is not visible here,
+        # so its mirror can go; update() then finds it missing once the job holds the lock and clones it again
+        entries = sorted(self.entries(), key=lambda entry: entry["last_used"])
+        total = sum(entry["size"] for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            with self.guard:
+                if self.in_use[entry["key"]]:
+                    continue
+                lock = self.lock(entry["key"])
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    shutil.rmtree(entry["path"], ignore_errors=True)
+                finally:
+                    lock.release()
+            total -= entry["size"]
+
+
+shared_mirror_cache = None
+mirror_cache_lock = threading.Lock()
+
+
+def get_mirror_cache():
+    global shared_mirror_cache
+    with mirror_cache_lock:
+        if shared_mirror_cache is None:
+            shared_mirror_cache = MirrorCache()
+        return shared_mirror_cache
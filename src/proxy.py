@@ -0,0 +1,142 @@
+import asyncio
+import os
+
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+
+from src.http_client import get_async_http_client
+from src.metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+from src.response_cache import AUTH_HEADERS, get_response_cache
+
+# Requests carrying these manage their own caching and always go upstream
+CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since', 'if-match', 'range')
+
+# Bodies are relayed still encoded, so cached responses are only shared between clients accepting the same encodings
+CACHE_VARY = ('accept-encoding',)
+
+# Headers that describe a single connection and must not be forwarded (RFC 7230 section 6.1)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade',
+}
+
+
+def strip_hop_by_hop(headers, extra=()):
+    # Headers named in Connection are hop-by-hop for this hop as well
+    connection_tokens = {
+        token.strip().lower()
+        for key, value in headers.items() if key.lower() == 'connection'
+        for token in value.split(',')
+    }
+    dropped = HOP_BY_HOP_HEADERS | connection_tokens | set(extra)
+    return [(key, value) for key, value in headers.items() if key.lower() not in dropped]
+
+
+class ReverseProxy:
+    def __init__(self, base_url=None, http=None, max_connections=None, cache=None):
+        self.cache = cache if cache is not None else get_response_cache()
+        self.base_url = (base_url or os.getenv('PROXY_UPSTREAM_URL', os.getenv('GITLAB_API_URL', "https://gitlab.com/api/v4"))).rstrip('/')
+        self.http = http or get_async_http_client()
+        self.max_connections = max_connections or int(os.getenv('PROXY_MAX_CONNECTIONS', 20))
+        self.semaphore = None
+
+    def get_semaphore(self):
+        # Created lazily so it binds to the running event loop
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_connections)
+        return self.semaphore
+
+    def upstream_url(self, path, query):
+        url = f"{self.base_url}/{path}"
+        return f"{url}?{query}" if query else url
+
+    def cacheable(self, request):
+        return (self.cache is not None and request.method == "GET"
+                and not any(name in request.headers for name in CONDITIONAL_HEADERS)
+                and 'no-cache' not in request.headers.get('cache-control', '').lower())
+
+    async def forward(self, request, path):
+        url = self.upstream_url(path, request.url.query)
+        headers = strip_hop_by_hop(request.headers, extra=('host',))
+
+        # Fresh GETs are answered from the cache; stale ones are revalidated upstream with their ETag
+        key = entry = None
+        if self.cacheable(request):
+            key = self.cache.key("GET", url, request.headers, namespace="proxy", vary=CACHE_VARY)
+            entry = await self.cache.run(self.cache.get, key)
+            if entry is not None and entry.fresh():
+                return Response(entry.body, status_code=entry.status_code, headers=entry.headers)
+            if entry is not None and entry.etag:
+                headers.append(('if-none-match', entry.etag))
+
+        semaphore = self.get_semaphore()
+        await semaphore.acquire()
+        try:
+            # The request body is relayed chunk by chunk instead of being read into memory first
+            has_body = 'content-length' in request.headers or 'transfer-encoding' in request.headers
+            # Time to response headers; the body is streamed to the client afterwards
+            with UPSTREAM_SECONDS.time(platform="proxy", method=request.method):
+                upstream = await self.http.stream(
+                    request.method,
+                    url,
+                    headers=headers,
+                    content=request.stream() if has_body else None,
+                )
+        except Exception:
+            UPSTREAM_REQUESTS.inc(platform="proxy", status="error")
+            semaphore.release()
+            raise
+        UPSTREAM_REQUESTS.inc(platform="proxy", status=upstream.status_code)
+
+        if key is not None:
+            cached = await self.from_cache(key, entry, upstream, semaphore)
+            if cached is not None:
+                return cached
+
+        released = False
+
+        async def release():
+            nonlocal released
+            if not released:
+                released = True
+                await upstream.aclose()
+                semaphore.release()
+
+        async def body():
+            # Raw chunks are relayed as they arrive; content-encoding is passed through untouched
+            try:
+                async for chunk in upstream.aiter_raw():
+                    yield chunk
+            finally:
+                await release()
+
+        return StreamingResponse(
+            body(),
+            status_code=upstream.status_code,
+            headers=dict(strip_hop_by_hop(upstream.headers)),
+            background=BackgroundTask(release),
+        )
+
+    async def from_cache(self, key, entry, upstream, semaphore):
+        # Returns a buffered response for 304 revalidations and small cacheable 200s; anything else is streamed
+        if upstream.status_code == 304 and entry is not None:
+            await upstream.aclose()
+            semaphore.release()
+            await self.cache.run(self.cache.revalidated, key)
+            return Response(entry.body, status_code=entry.status_code, headers=entry.headers)
+
+        length = upstream.headers.get('content-length')
+        if upstream.status_code != 200 or not length or int(length) > self.cache.max_entry_bytes:
+            return None
+        # A body that depends on request headers the key does not cover would be served to the wrong clients
+        vary = {name.strip().lower() for name in upstream.headers.get('vary', '').split(',') if name.strip()}
+        if not vary <= set(CACHE_VARY + AUTH_HEADERS):
+            return None
+        try:
+            body = b"".join([chunk async for chunk in upstream.aiter_raw()])
+        finally:
+            await upstream.aclose()
+            semaphore.release()
+        headers = dict(strip_hop_by_hop(upstream.headers))
+        await self.cache.run(self.cache.store, key, upstream.status_code, headers, body)
+        return Response(body, status_code=upstream.status_code, headers=headers)
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from src.metrics import RATE_LIMIT_REMAINING
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+
+class RateLimiter:
+    # Header names used by GitHub (X-RateLimit-*), GitLab (RateLimit-*) and Azure DevOps (X-RateLimit-*)
+    REMAINING_HEADERS = ('x-ratelimit-remaining', 'ratelimit-remaining')
+    RESET_HEADERS = ('x-ratelimit-reset', 'ratelimit-reset')
+
+    def __init__(self, platform, max_concurrency=None, reserve=None):
+        self.platform = platform
+        self.max_concurrency = max_concurrency or int(os.getenv(f'{platform.upper()}_MAX_CONCURRENCY', 4))
+        self.reserve = reserve if reserve is not None else int(os.getenv('RATE_LIMIT_RESERVE', 5))
+        self.semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self.lock = threading.Lock()
+        self.pause_until = 0.0
+        self.remaining = None
+
+    @contextmanager
+    def slot(self):
+        # Cap concurrent work against the platform and wait out any rate-limit pause
+        with self.semaphore:
+            self.wait()
+            yield
+
+    def wait(self):
+        delay = self.pause_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, headers):
+        headers = {key.lower(): value for key, value in headers.items()}
+        pause_until = None
+
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            pause_until = time.time() + parse_retry_after(retry_after)
+
+        remaining = self.first_int(headers, self.REMAINING_HEADERS)
+        if remaining is not None:
+            self.remaining = remaining
+            RATE_LIMIT_REMAINING.set(remaining, platform=self.platform)
+            reset = self.first_int(headers, self.RESET_HEADERS)
+            if remaining <= self.reserve and reset:
+                pause_until = max(pause_until or 0, float(reset))
+
+        if pause_until:
+            with self.lock:
+                self.pause_until = max(self.pause_until, pause_until)
+
+    def first_int(self, headers, names):
+        for name in names:
+            value = headers.get(name)
+            if value is not None:
+                try:
+                    return int(float(value))
+                except ValueError:
+                    return None
+        return None
+
+
+shared_limiters = {}
+limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(platform):
+    # One limiter per platform for the whole process, however many clients are created
+    with limiters_lock:
+        if platform not in shared_limiters:
+            shared_limiters[platform] = RateLimiter(platform)
+        return shared_limiters[platform]
+
+
+@contextmanager
+def slots(*limiters):
+    # Holds a slot on several platforms at once. Each limiter is taken once, always in platform
+    # order, so jobs moving in opposite directions cannot deadlock waiting on each other
+    unique = {limiter.platform: limiter for limiter in limiters}
+    ordered = [unique[platform] for platform in sorted(unique)]
+    acquired = []
+    try:
+        for limiter in ordered:
+            limiter.semaphore.acquire()
+            acquired.append(limiter)
+        for limiter in ordered:
+            limiter.wait()
+        yield
+    finally:
+        for limiter in reversed(acquired):
+            limiter.semaphore.release()
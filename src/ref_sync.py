@@ -0,0 +1,31 @@
+from git import Git
+
+# Only branches and tags are synced; provider-owned refs (refs/pull, refs/merge-requests) are read-only on targets
+SYNCED_REF_PREFIXES = ('refs/heads/', 'refs/tags/')
+
+
+def parse_refs(output):
+    refs = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        sha, ref = parts
+        if ref.startswith(SYNCED_REF_PREFIXES) and not ref.endswith('^{}'):
+            refs[ref] = sha
+    return refs
+
+
+def ls_remote(url):
+    # Ask the server for its ref tips without fetching any objects
+    return parse_refs(Git().ls_remote(url))
+
+
+def diff_refs(source_refs, target_refs, prune=True):
+    updated = sorted(ref for ref, sha in source_refs.items() if target_refs.get(ref) != sha)
+    deleted = sorted(ref for ref in target_refs if ref not in source_refs) if prune else []
+    return updated, deleted
+
+
+def refspecs(updated, deleted):
+    return [f"+{ref}:{ref}" for ref in updated] + [f":{ref}" for ref in deleted]
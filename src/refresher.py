@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.metrics import span
+from src.timeutil import isoformat
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogueRefresher:
+    # Keeps the repositories table current in the background. The first cycle and every
+    # REFRESH_FULL_EVERY-th cycle re-list everything and prune; the cycles in between only fetch
+    # repositories changed since the previous cycle started, and never delete
+    def __init__(self, migrator, indexer, interval=None, platforms=None, full_every=None, overlap=None, leader=None):
+        self.migrator = migrator
+        self.indexer = indexer
+        self.interval = interval if interval is not None else float(os.getenv('REFRESH_INTERVAL', 900))
+        configured = os.getenv('REFRESH_PLATFORMS')
+        if platforms is None and configured:
+            platforms = [platform.strip().lower() for platform in configured.split(',') if platform.strip()]
+        self.platforms = platforms if platforms is not None else migrator.configured_platforms()
+        self.full_every = full_every or int(os.getenv('REFRESH_FULL_EVERY', 24))
+        # Changes reported slightly late upstream are still picked up by the next cycle
+        self.overlap = timedelta(seconds=overlap if overlap is not None else float(os.getenv('REFRESH_OVERLAP', 300)))
+        self.watermarks = {}
+        self.status = {}
+        self.cycles = 0
+        self.force_full = False
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        # A FileLock that makes this the only worker refreshing, when several share the database
+        self.leader = leader
+
+    def start(self):
+        if self.interval <= 0 or not self.platforms or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, name="catalogue-refresh", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+    def trigger(self, full=False):
+        # Runs a cycle now instead of waiting for the interval
+        with self.lock:
+            self.force_full = self.force_full or full
+        self.wake.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            # Workers without the lock keep trying it each interval, so one takes over if the leader exits
+            if self.is_leader():
+                self.refresh_all()
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def is_leader(self):
+        return self.leader is None or self.leader.acquire(blocking=False)
+
+    def refresh_all(self):
+        with self.lock:
+            full = self.force_full or self.cycles % self.full_every == 0
+            self.force_full = False
+            self.cycles += 1
+        for platform in self.platforms:
+            if self.stopped.is_set():
+                return
+            try:
+                self.refresh(platform, full)
+            except Exception as e:
+                logger.warning("Catalogue refresh of %s failed: %s", platform, e)
+                with self.lock:
+                    self.status.setdefault(platform, {}).update({"error": str(e), "failed_at": time.time()})
+
+    def refresh(self, platform, full=False):
+        started = datetime.now(timezone.utc)
+        since = self.watermarks.get(platform)
+        incremental = not full and since is not None
+
+        with span("refresh", platform):
+            # The listing is collected before indexing so the write transaction never waits on upstream calls
+            if incremental:
+                repositories = list(self.migrator.iter_changed_repositories(platform, since - self.overlap))
+            else:
+                repositories = list(self.migrator.iter_repositories(platform, per_page=100))
+
+            result = None
+            # Listings raise when a page fails, so a partial listing never gets here. An empty full
+            # listing is still far more likely an upstream failure than an empty platform
+            if repositories:
+                result = self.indexer.index(platform, repositories, prune=not incremental)
+
+        self.watermarks[platform] = started
+        with self.lock:
+            self.status[platform] = {
+                "mode": "incremental" if incremental else "full",
+                "since": isoformat(since - self.overlap) if incremental else None,
+                "fetched": len(repositories),
+                "indexing": result,
+                "watermark": isoformat(started),
+                "finished_at": time.time(),
+                "error": None,
+            }
+        return self.status[platform]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.thread is not None,
+                "leader": self.leader is None or self.leader.held,
+                "interval": self.interval,
+                "platforms": self.platforms,
+                "cycles": self.cycles,
+                "full_every": self.full_every,
+                "status": {platform: dict(status) for platform, status in self.status.items()},
+            }
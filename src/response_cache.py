@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Request headers that decide whose view of the upstream API a response belongs to
+AUTH_HEADERS = ('authorization', 'private-token', 'job-token', 'cookie')
+
+
+class CacheEntry:
+    def __init__(self, status_code, headers, body, etag=None, expires_at=0.0):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+    def fresh(self):
+        return time.time() < self.expires_at
+
+    def size(self):
+        return len(self.body)
+
+
+class MemoryCacheBackend:
+    name = "memory"
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+        self.max_bytes = max_bytes or int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        evicted = 0
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.size()
+            self.entries[key] = entry
+            self.bytes += entry.size()
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, oldest = self.entries.popitem(last=False)
+                self.bytes -= oldest.size()
+                evicted += 1
+        return evicted
+
+    def touch(self, key, expires_at):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.expires_at = expires_at
+                self.entries.move_to_end(key)
+
+    def size(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.bytes}
+
+
+class SQLiteCacheBackend:
+    name = "sqlite"
+
+    def __init__(self, path=None, max_entries=None, max_bytes=None):
+        self.path = path or os.getenv('RESPONSE_CACHE_PATH', 'response_cache.db')
+        self.max_entries = max_entries or int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+        self.max_bytes = max_bytes or int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY, status_code INTEGER, headers TEXT, body BLOB,
+                etag TEXT, expires_at REAL, last_used REAL, size INTEGER
+            )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS response_cache_last_used ON response_cache (last_used)")
+
+    def connection(self):
+        # sqlite3 connections cannot be shared across threads, so each thread opens its own
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        with self.connection() as connection:
+            row = connection.execute(
+                "SELECT status_code, headers, body, etag, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        status_code, headers, body, etag, expires_at = row
+        return CacheEntry(status_code, json.loads(headers), body, etag, expires_at)
+
+    def set(self, key, entry):
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.status_code, json.dumps(entry.headers), entry.body, entry.etag,
+                 entry.expires_at, time.time(), entry.size())
+            )
+            return self.evict(connection)
+
+    def evict(self, connection):
+        # Drop least recently used rows until both limits hold
+        evicted = 0
+        entries, total = connection.execute("SELECT count(*), coalesce(sum(size), 0) FROM response_cache").fetchone()
+        while entries > self.max_entries or total > self.max_bytes:
+            row = connection.execute(
+                "SELECT key, size FROM response_cache ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            connection.execute("DELETE FROM response_cache WHERE key = ?", (row[0],))
+            entries -= 1
+            total -= row[1]
+            evicted += 1
+        return evicted
+
+    def touch(self, key, expires_at):
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE response_cache SET expires_at = ?, last_used = ? WHERE key = ?", (expires_at, time.time(), key)
+            )
+
+    def size(self):
+        with self.connection() as connection:
+            entries, total = connection.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM response_cache"
+            ).fetchone()
+        return {"entries": entries, "bytes": total}
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl=None, max_entry_bytes=None):
+        self.backend = backend
+        self.ttl = ttl if ttl is not None else float(os.getenv('RESPONSE_CACHE_TTL', 60))
+        self.max_entry_bytes = max_entry_bytes or int(os.getenv('RESPONSE_CACHE_MAX_ENTRY_BYTES', 5 * 1024 ** 2))
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def key(self, method, url, headers=None, namespace="http", vary=()):
+        # Responses are only shared between callers presenting the same credentials, and the same
+        # values of any `vary` request headers. The proxy stores raw (possibly compressed) bodies,
+        # so it keeps its own namespace and varies on accept-encoding
+        scoped = AUTH_HEADERS + tuple(name.lower() for name in vary)
+        scope = "\n".join(sorted(
+            f"{name.lower()}:{value}" for name, value in (headers or {}).items() if name.lower() in scoped
+        ))
+        return hashlib.sha256(f"{namespace} {method.upper()} {url}\n{scope}".encode()).hexdigest()
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self.count("misses")
+        elif entry.fresh():
+            self.count("hits")
+        else:
+            self.count("stale")
+        return entry
+
+    def store(self, key, status_code, headers, body):
+        headers = {name.lower(): value for name, value in headers.items()}
+        if status_code != 200 or len(body) > self.max_entry_bytes:
+            return
+        if 'no-store' in headers.get('cache-control', '').lower():
+            return
+        entry = CacheEntry(status_code, headers, body, headers.get('etag'), time.time() + self.ttl)
+        self.count("stores")
+        self.count("evictions", self.backend.set(key, entry))
+
+    def revalidated(self, key):
+        # A 304 proves the cached body is still current, so it gets a fresh TTL
+        self.count("revalidated")
+        self.backend.touch(key, time.time() + self.ttl)
+
+    async def run(self, func, *args):
+        # The SQLite backend does disk I/O, which is kept off the event loop
+        if self.backend.name == "memory":
+            return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        counters["backend"] = self.backend.name
+        counters["ttl"] = self.ttl
+        counters.update(self.backend.size())
+        return counters
+
+
+shared_cache = None
+shared_lock = threading.Lock()
+
+
+def get_response_cache():
+    # RESPONSE_CACHE selects the backend: memory (default), sqlite to survive restarts, or off
+    global shared_cache
+    with shared_lock:
+        if shared_cache is None:
+            backend = os.getenv('RESPONSE_CACHE', 'memory').lower()
+            if backend in ('off', 'none', 'false', '0'):
+                return None
+            shared_cache = ResponseCache(SQLiteCacheBackend() if backend == 'sqlite' else MemoryCacheBackend())
+        return shared_cache
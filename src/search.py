@@ -0,0 +1,109 @@
+import logging
+import re
+
+from sqlalchemy import or_, text
+from sqlalchemy.exc import OperationalError
+
+# Column weights for bm25(): a hit in the name counts most, then path, then description
+RANK_WEIGHTS = "10.0, 2.0, 5.0, 0.0"
+
+logger = logging.getLogger(__name__)
+
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS repositories_fts USING fts5(
+        name, description, path, platform,
+        content='repositories', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS repositories_fts_insert AFTER INSERT ON repositories BEGIN
+        INSERT INTO repositories_fts(rowid, name, description, path, platform)
+        VALUES (new.id, new.name, new.description, new.path, new.platform);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS repositories_fts_delete AFTER DELETE ON repositories BEGIN
+        INSERT INTO repositories_fts(repositories_fts, rowid, name, description, path, platform)
+        VALUES ('delete', old.id, old.name, old.description, old.path, old.platform);
+    END""",
+    # Re-indexing rewrites every row; only rows whose searchable text changed touch the FTS index
+    """CREATE TRIGGER IF NOT EXISTS repositories_fts_update AFTER UPDATE ON repositories
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description
+        OR old.path IS NOT new.path OR old.platform IS NOT new.platform
+    BEGIN
+        INSERT INTO repositories_fts(repositories_fts, rowid, name, description, path, platform)
+        VALUES ('delete', old.id, old.name, old.description, old.path, old.platform);
+        INSERT INTO repositories_fts(rowid, name, description, path, platform)
+        VALUES (new.id, new.name, new.description, new.path, new.platform);
+    END""",
+]
+
+
+class SearchIndex:
+    def __init__(self, engine, model):
+        self.engine = engine
+        self.model = model
+        self.enabled = False
+
+    def ensure(self):
+        # Creates the FTS5 table and its sync triggers; falls back to LIKE search when FTS5 is unavailable
+        if self.engine.dialect.name != "sqlite":
+            return
+        try:
+            with self.engine.begin() as connection:
+                existed = connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'repositories_fts'"
+                )).first() is not None
+                for statement in FTS_SCHEMA:
+                    connection.execute(text(statement))
+                if not existed:
+                    connection.execute(text("INSERT INTO repositories_fts(repositories_fts) VALUES ('rebuild')"))
+            self.enabled = True
+        except OperationalError as e:
+            logger.warning("Full-text search unavailable, falling back to LIKE: %s", e)
+            self.enabled = False
+
+    def drop(self):
+        if self.engine.dialect.name == "sqlite":
+            with self.engine.begin() as connection:
+                connection.execute(text("DROP TABLE IF EXISTS repositories_fts"))
+
+    def match_expression(self, query):
+        # Every word must match, each as a prefix: "api gate" finds "api-gateway"
+        terms = re.findall(r"[^\W_]+", query)
+        return " ".join(f'"{term}"*' for term in terms)
+
+    def search(self, session, query, platform=None, limit=20, offset=0):
+        match = self.match_expression(query)
+        if not match:
+            return [], 0
+        if not self.enabled:
+            return self.search_like(session, query, platform, limit, offset)
+
+        platform_filter = "AND r.platform = :platform" if platform else ""
+        params = {"match": match, "platform": platform.lower() if platform else None,
+                  "limit": limit, "offset": offset}
+        rows = session.execute(text(f"""
+            SELECT r.id FROM repositories_fts
+            JOIN repositories r ON r.id = repositories_fts.rowid
+            WHERE repositories_fts MATCH :match {platform_filter}
+            ORDER BY bm25(repositories_fts, {RANK_WEIGHTS})
+            LIMIT :limit OFFSET :offset
+        """), params).fetchall()
+        total = session.execute(text(f"""
+            SELECT count(*) FROM repositories_fts
+            JOIN repositories r ON r.id = repositories_fts.rowid
+            WHERE repositories_fts MATCH :match {platform_filter}
+        """), params).scalar()
+
+        ids = [row[0] for row in rows]
+        repositories = {repo.id: repo for repo in session.query(self.model).filter(self.model.id.in_(ids))}
+        return [repositories[repo_id] for repo_id in ids if repo_id in repositories], total
+
+    def search_like(self, session, query, platform=None, limit=20, offset=0):
+        pattern = f"%{query}%"
+        results = session.query(self.model).filter(or_(
+            self.model.name.ilike(pattern),
+            self.model.description.ilike(pattern),
+            self.model.path.ilike(pattern),
+        ))
+        if platform:
+            results = results.filter(self.model.platform == platform.lower())
+        total = results.count()
+        return results.order_by(self.model.name).limit(limit).offset(offset).all(), total
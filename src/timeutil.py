@@ -0,0 +1,25 @@
+import re
+from datetime import datetime, timezone
+
+# Platforms disagree on fractional digits (GitLab 3, Azure up to 7) and use "Z" for UTC
+FRACTION_PATTERN = re.compile(r"\.(\d+)")
+
+
+def parse_timestamp(value):
+    # ISO 8601 string from any of the platforms -> aware UTC datetime, or None when missing or malformed
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    text = value.strip().replace("Z", "+00:00")
+    text = FRACTION_PATTERN.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), text, count=1)
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def isoformat(moment):
+    # The form every platform accepts in query strings: 2024-01-31T12:00:00Z
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
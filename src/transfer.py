@@ -0,0 +1,336 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from git import GitCommandError, RemoteProgress, Repo
+from git.cmd import handle_process_output
+from git.util import finalize_process
+
+import src.ref_sync as ref_sync
+from src.locks import FileLock
+from src.metrics import TRANSFER_BYTES, span
+
+# git prints the amount sent or received at the end of the progress line, e.g. "1.20 MiB | 2.00 MiB/s"
+SIZE_PATTERN = re.compile(r"([\d.]+) (bytes|KiB|MiB|GiB)")
+SIZE_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+
+class TransferProgress(RemoteProgress):
+    # Turns git's --progress output into (stage, phase, current, total) callbacks
+    PHASES = {
+        RemoteProgress.COUNTING: "counting",
+        RemoteProgress.COMPRESSING: "compressing",
+        RemoteProgress.WRITING: "writing",
+        RemoteProgress.RECEIVING: "receiving",
+        RemoteProgress.RESOLVING: "resolving",
+        RemoteProgress.FINDING_SOURCES: "finding sources",
+    }
+
+    def __init__(self, stage, callback):
+        super().__init__()
+        self.stage = stage
+        self.callback = callback
+
+    def update(self, op_code, cur_count, max_count=None, message=''):
+        phase = self.PHASES.get(op_code & self.OP_MASK, "working")
+        if op_code & self.END and phase in ("writing", "receiving"):
+            self.count_bytes("push" if phase == "writing" else "fetch", message)
+        self.callback(self.stage, phase=phase, current=cur_count, total=max_count, message=message or None)
+
+    def count_bytes(self, direction, message):
+        match = SIZE_PATTERN.search(message or '')
+        if match:
+            TRANSFER_BYTES.inc(int(float(match.group(1)) * SIZE_UNITS[match.group(2)]), direction=direction)
+
+
+def run_with_progress(git, stage, callback, command, *args):
+    # Runs a git command with --progress and reports its phases; errors carry git's own explanation
+    progress = TransferProgress(stage, callback)
+    # Text mode splits git's carriage-return progress updates into separate lines, as GitPython's own fetch does
+    process = getattr(git, command)('--progress', *args, as_process=True, universal_newlines=True)
+    try:
+        handle_process_output(process, None, progress.new_message_handler(), finalize_process, decode_streams=False)
+    except GitCommandError as e:
+        details = "\n".join(progress.error_lines or progress.other_lines[-5:])
+        raise GitCommandError(e.command, e.status, details or e.stderr) from e
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+class ScratchSpace:
+    # Disk budget shared by every pipeline transfer on the host. Pushed objects stay in a job's workspace
+    # until it ends, so jobs reserve SCRATCH_JOB_BYTES of the SCRATCH_QUOTA_BYTES before fetching anything
+    # and never wait on each other's half-finished workspaces. Reservations are files next to the
+    # workspaces, each flocked by its job, so worker processes sharing SCRATCH_DIR see them too
+    def __init__(self, root=None, quota=None, job_bytes=None, wait_timeout=None):
+        # Absolute, so workspace paths (the reservation keys) stay the same whatever the working directory
+        self.root = os.path.abspath(
+            root or os.getenv('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), "migration-scratch")))
+        self.quota = quota or int(os.getenv('SCRATCH_QUOTA_BYTES', 10 * 1024 ** 3))
+        self.job_bytes = min(job_bytes or int(os.getenv('SCRATCH_JOB_BYTES', self.quota // 4)), self.quota)
+        self.wait_timeout = wait_timeout or float(os.getenv('SCRATCH_WAIT_TIMEOUT', 600))
+        self.condition = threading.Condition()
+        self.holders = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    @contextmanager
+    def workspace(self):
+        path = tempfile.mkdtemp(dir=self.root, suffix=".git")
+        try:
+            self.reserve(path)
+            yield path
+        finally:
+            # Removed on success and on failure alike; waiting jobs are woken to re-check the budget
+            with span("cleanup"):
+                shutil.rmtree(path, ignore_errors=True)
+            self.release(path)
+            with self.condition:
+                self.condition.notify_all()
+
+    def lock(self):
+        return FileLock(os.path.join(self.root, "reservations.lock"))
+
+    def reservations(self):
+        # Reservations of running jobs by workspace; one nobody holds belongs to a job whose process died,
+        # and is dropped together with its workspace. Called with the reservations lock held
+        reservations = {}
+        for name in os.listdir(self.root):
+            if not name.endswith(".reservation"):
+                continue
+            record = os.path.join(self.root, name)
+            workspace = record[:-len(".reservation")]
+            if workspace not in self.holders:
+                orphan = FileLock(record)
+                if orphan.acquire(blocking=False):
+                    orphan.release()
+                    shutil.rmtree(workspace, ignore_errors=True)
+                    os.remove(record)
+                    continue
+            try:
+                with open(record) as handle:
+                    reservations[workspace] = json.load(handle)
+            except (OSError, ValueError):
+                continue
+        return reservations
+
+    def write(self, path, reservation):
+        fd = self.holders[path].fd
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, json.dumps(reservation).encode(), 0)
+
+    def free(self, reservations):
+        return self.quota - sum(reservation["bytes"] for reservation in reservations.values())
+
+    def reserve(self, path):
+        # Admission waits for whole jobs to finish, and gives way to a job waiting to grow
+        deadline = time.time() + self.wait_timeout
+        with self.condition:
+            while True:
+                with self.lock():
+                    reservations = self.reservations()
+                    waiting = any(reservation["waiting"] for reservation in reservations.values())
+                    if not waiting and self.free(reservations) >= self.job_bytes:
+                        holder = FileLock(f"{path}.reservation")
+                        holder.acquire()
+                        self.holders[path] = holder
+                        self.write(path, {"bytes": self.job_bytes, "since": time.time(), "waiting": False})
+                        return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception("Timed out waiting for scratch space")
+                self.condition.wait(min(remaining, 5))
+
+    def release(self, path):
+        holder = self.holders.pop(path, None)
+        if holder is not None:
+            with self.lock():
+                os.remove(holder.path)
+                holder.release()
+
+    def wait_for_room(self, path):
+        # Called before each fetch. Past its reservation a job grows into budget nobody has reserved.
+        # When there is none, only the oldest job waits for more and every other job fails, so no
+        # two jobs ever wait on each other
+        used = directory_size(path)
+        if used >= self.quota:
+            raise Exception(f"Repository does not fit in the scratch quota of {self.quota} bytes")
+        deadline = time.time() + self.wait_timeout
+        with self.condition:
+            while True:
+                with self.lock():
+                    reservations = self.reservations()
+                    reservation = reservations[path]
+                    if used < reservation["bytes"]:
+                        return
+                    grown = min(reservation["bytes"] + self.free(reservations), used + self.job_bytes)
+                    if grown > used:
+                        self.write(path, {**reservation, "bytes": grown, "waiting": False})
+                        return
+                    oldest = min(reservations, key=lambda other: (reservations[other]["since"], other))
+                    if oldest != path:
+                        raise Exception(f"Repository outgrew its scratch reservation of {reservation['bytes']} "
+                                        "bytes while older migrations hold the rest of the quota")
+                    self.write(path, {**reservation, "waiting": True})
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception("Timed out waiting for scratch space")
+                self.condition.wait(min(remaining, 5))
+
+
+shared_scratch = None
+scratch_lock = threading.Lock()
+
+
+def get_scratch_space():
+    global shared_scratch
+    with scratch_lock:
+        if shared_scratch is None:
+            shared_scratch = ScratchSpace()
+        return shared_scratch
+
+
+class MirrorTransfer:
+    # One clone, one push of every ref: the original behaviour, best for small and medium repositories
+    name = "mirror"
+    clone_filter = None
+    uses_mirror = True
+
+    def __init__(self, progress=None, lfs=False):
+        self.progress = progress or (lambda stage, **info: None)
+        self.lfs = lfs
+
+    def push(self, repo, target_url, refspecs=None):
+        self.push_refs(repo, target_url, refspecs, stage="push")
+        if self.lfs:
+            self.push_lfs(repo, target_url)
+
+    def push_refs(self, repo, target_url, refspecs=None, stage="push"):
+        args = [target_url, *refspecs] if refspecs is not None else ['--mirror', target_url]
+        run_with_progress(repo.git, stage, self.progress, 'push', *args)
+
+    def push_lfs(self, repo, target_url):
+        # LFS objects live outside the git object store, so they are copied with git-lfs after the refs
+        if shutil.which("git-lfs") is None:
+            raise Exception("LFS transfer requested but git-lfs is not installed")
+        self.progress("lfs-fetch")
+        repo.git.lfs('fetch', '--all', 'origin')
+        self.progress("lfs-push")
+        repo.git.lfs('push', '--all', target_url)
+
+
+class ChunkedTransfer(MirrorTransfer):
+    # Pushes each branch's first-parent history in batches of commits before the final push,
+    # so no single pack exceeds provider pack-size limits and a failure only loses one batch
+    name = "chunked"
+
+    def __init__(self, progress=None, lfs=False, batch_size=None):
+        super().__init__(progress, lfs)
+        self.batch_size = batch_size or int(os.getenv('TRANSFER_CHUNK_COMMITS', 2000))
+
+    def push(self, repo, target_url, refspecs=None):
+        # History the target already has: every ref tip on it, plus each chunk pushed so far,
+        # so branches sharing history with an earlier one only chunk what they add
+        sent = set(ref_sync.ls_remote(target_url).values())
+        branches = self.branches(repo, refspecs)
+        for number, branch in enumerate(branches, start=1):
+            commits = self.pending_commits(repo, branch, sent)
+            batches = list(range(self.batch_size, len(commits), self.batch_size))
+            for batch, end in enumerate(batches, start=1):
+                self.progress("push-chunk", branch=branch, branch_number=number, branches=len(branches),
+                              current=batch, total=len(batches))
+                self.push_refs(repo, target_url, [f"+{commits[end - 1]}:{branch}"], stage="push-chunk")
+                sent.add(commits[end - 1])
+
+        # Everything left (branch tips, tags, deletions) now only needs a small final pack
+        super().push(repo, target_url, refspecs)
+
+    def branches(self, repo, refspecs=None):
+        if refspecs is not None:
+            return [spec.split(':')[-1] for spec in refspecs if spec.startswith('+refs/heads/')]
+        output = repo.git.for_each_ref('--format=%(refname)', 'refs/heads')
+        return [line for line in output.splitlines() if line]
+
+    def pending_commits(self, repo, branch, exclude=()):
+        # Target tips the mirror has never seen (e.g. commits made on the target) are skipped by --ignore-missing
+        args = ['--first-parent', '--reverse', '--ignore-missing', branch, *(f'^{sha}' for sha in sorted(exclude))]
+        output = repo.git.rev_list(*args)
+        return [line for line in output.splitlines() if line]
+
+
+class PartialTransfer(ChunkedTransfer):
+    # Blobless clone: commits and trees arrive quickly, and git (2.33+) prefetches the blobs each
+    # chunk needs in one batch while packing it, so file contents download as the push progresses
+    name = "partial"
+    clone_filter = "blob:none"
+
+
+class PipelineTransfer(MirrorTransfer):
+    # Skips the cached full mirror: refs are fetched in batches into a throwaway bare repository,
+    # and each batch is pushed while the next one downloads. Disk use is bounded by the scratch quota
+    name = "pipeline"
+    uses_mirror = False
+
+    def __init__(self, progress=None, lfs=False, batch_size=None, scratch=None):
+        super().__init__(progress, lfs)
+        self.batch_size = batch_size or int(os.getenv('PIPELINE_BATCH_REFS', 20))
+        self.scratch = scratch or get_scratch_space()
+
+    def transfer(self, source_url, target_url, refspecs=None):
+        if refspecs is None:
+            # Same result as a mirror push: every source ref, and nothing on the target that the source lacks
+            updated, deleted = ref_sync.diff_refs(ref_sync.ls_remote(source_url), ref_sync.ls_remote(target_url))
+            refspecs = ref_sync.refspecs(updated, deleted)
+        updates = [spec for spec in refspecs if not spec.startswith(':')]
+        deletions = [spec for spec in refspecs if spec.startswith(':')]
+        # Branches before tags, so most tags arrive with objects already on the target
+        updates.sort(key=lambda spec: (not spec.startswith('+refs/heads/'), spec))
+        batches = [updates[start:start + self.batch_size] for start in range(0, len(updates), self.batch_size)]
+
+        with self.scratch.workspace() as path:
+            repo = Repo.init(path, bare=True)
+            repo.create_remote('origin', source_url)
+            if batches:
+                # One fetch runs ahead of the push; objects already fetched are never downloaded twice
+                with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-fetch") as executor:
+                    pending = executor.submit(self.fetch_batch, repo, path, batches[0], 1, len(batches))
+                    for number, batch in enumerate(batches, start=1):
+                        pending.result()
+                        if number < len(batches):
+                            pending = executor.submit(self.fetch_batch, repo, path, batches[number],
+                                                      number + 1, len(batches))
+                        self.progress("push-batch", current=number, total=len(batches), refs=len(batch))
+                        self.push_refs(repo, target_url, batch, stage="push-batch")
+            if deletions:
+                self.push_refs(repo, target_url, deletions)
+            if self.lfs:
+                self.push_lfs(repo, target_url)
+
+    def fetch_batch(self, repo, path, batch, number, total):
+        self.scratch.wait_for_room(path)
+        self.progress("fetch-batch", current=number, total=total, refs=len(batch))
+        run_with_progress(repo.git, "fetch-batch", self.progress, 'fetch', '--no-tags', 'origin', *batch)
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (MirrorTransfer, ChunkedTransfer, PartialTransfer, PipelineTransfer)}
+
+
+def get_transfer(name=None, progress=None, lfs=False):
+    name = (name or "mirror").lower()
+    if name not in STRATEGIES:
+        raise ValueError(f"Unsupported transfer strategy: {name}")
+    return STRATEGIES[name](progress=progress, lfs=lfs)
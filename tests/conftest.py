@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service is run from the repository root, where `src` and `move_repo` are importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,11 @@
+import os
+import subprocess
+
+IDENTITY = {"GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com",
+            "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com"}
+
+
+def git(*args, cwd=None):
+    # Runs the git CLI with a fixed identity and returns its output
+    return subprocess.run(["git", *args], cwd=cwd, env={**os.environ, **IDENTITY}, check=True,
+                          capture_output=True, text=True).stdout.strip()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+
+WORKDIR = tempfile.mkdtemp(prefix="listing-test-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(WORKDIR, 'repositories.db')}",
+    "LOCK_DIR": os.path.join(WORKDIR, "locks"),
+    "REFRESH_INTERVAL": "0",
+    "RESPONSE_CACHE": "off",
+})
+
+import requests
+from fastapi.testclient import TestClient
+
+import move_repo
+from src.github import GitHub
+
+
+class FakeUpstream:
+    # Answers every GET with the given status and a page of two repositories
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def get(self, url, **kwargs):
+        response = requests.Response()
+        response.url = url
+        response.status_code = self.status_code
+        response._content = b'[{"id": 1, "name": "one"}, {"id": 2, "name": "two"}]'
+        return response
+
+
+class StreamListingTest(unittest.TestCase):
+    def client(self, status_code):
+        migrator = move_repo.RepoMigrator()
+        migrator.github = GitHub("token", http=FakeUpstream(status_code))
+        move_repo.app.dependency_overrides[move_repo.get_migrator] = lambda: migrator
+        self.addCleanup(move_repo.app.dependency_overrides.clear)
+        return TestClient(move_repo.app)
+
+    def test_streams_one_repository_per_line(self):
+        response = self.client(200).get("/repositories/github", params={"stream": "true"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line for line in response.text.splitlines()],
+                         ['{"id": 1, "name": "one"}', '{"id": 2, "name": "two"}'])
+
+    def test_first_page_failure_is_a_server_error(self):
+        response = self.client(502).get("/repositories/github", params={"stream": "true"})
+
+        self.assertEqual(response.status_code, 500)
+
+    def test_indexing_is_rejected(self):
+        response = self.client(200).get("/repositories/github", params={"stream": "true", "indexing": "true"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from git import GitCommandError
+
+from git_helpers import git
+from src.mirror_cache import MirrorCache
+
+
+class MirrorCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="mirror-cache-test-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        work = os.path.join(self.root, "work")
+        git("init", "--quiet", "--initial-branch=main", work)
+        git("commit", "--quiet", "--allow-empty", "-m", "first", cwd=work)
+        self.source = os.path.join(self.root, "source.git")
+        git("clone", "--quiet", "--bare", work, self.source)
+        self.source_url = f"file://{self.source}"
+        self.cache = MirrorCache(root=os.path.join(self.root, "cache"))
+
+    def test_mirror_survives_an_unreachable_source(self):
+        path = self.cache.path(self.source_url)
+        self.cache.update(self.source_url)
+        shutil.rmtree(self.source)
+
+        with self.assertRaises(GitCommandError):
+            self.cache.update(self.source_url)
+        self.assertTrue(os.path.isdir(path))
+        self.assertIsNotNone(self.cache.open(path))
+
+    def test_corrupt_mirror_is_rebuilt(self):
+        path = self.cache.path(self.source_url)
+        self.cache.update(self.source_url)
+        shutil.rmtree(os.path.join(path, "objects"))
+
+        repo = self.cache.update(self.source_url)
+        self.assertEqual(repo.git.rev_parse("HEAD"), git("--git-dir", self.source, "rev-parse", "HEAD"))
+
+
+if __name__ == "__main__":
+    unittest.main()
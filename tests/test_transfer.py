@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from git import Repo
+
+from git_helpers import git
+from src.transfer import ChunkedTransfer, ScratchSpace
+
+
+class ChunkedTransferTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="transfer-test-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        work = os.path.join(self.root, "work")
+        git("init", "--quiet", "--initial-branch=main", work)
+        for number in range(1, 11):
+            git("commit", "--quiet", "--allow-empty", "-m", f"main {number}", cwd=work)
+        # Two branches off main's tip, one commit each
+        for branch in ("feature-a", "feature-b"):
+            git("checkout", "--quiet", "-b", branch, "main", cwd=work)
+            git("commit", "--quiet", "--allow-empty", "-m", branch, cwd=work)
+        self.source = os.path.join(self.root, "source.git")
+        git("clone", "--quiet", "--mirror", work, self.source)
+        self.target = os.path.join(self.root, "target.git")
+        git("init", "--quiet", "--bare", self.target)
+
+    def push(self, batch_size):
+        chunks = []
+
+        def progress(stage, **info):
+            if stage == "push-chunk" and "branch" in info:
+                chunks.append(info["branch"])
+
+        ChunkedTransfer(progress=progress, batch_size=batch_size).push(Repo(self.source), self.target)
+        return chunks
+
+    def test_shared_history_is_chunked_once(self):
+        # 11 commits on the first branch go in chunks of 3; the other two branches add one commit each
+        chunks = self.push(batch_size=3)
+
+        self.assertEqual(len(chunks), 3)
+        for branch in ("main", "feature-a", "feature-b"):
+            self.assertEqual(git("--git-dir", self.target, "rev-parse", branch),
+                             git("--git-dir", self.source, "rev-parse", branch))
+
+    def test_history_already_on_the_target_is_skipped(self):
+        git("--git-dir", self.source, "push", "--quiet", self.target, "main~2:refs/heads/main")
+
+        self.assertEqual(self.push(batch_size=3), [])
+
+
+class ScratchSpaceTest(unittest.TestCase):
+    def test_relative_scratch_dir(self):
+        root = tempfile.mkdtemp(prefix="scratch-test-")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(root)
+        scratch = ScratchSpace(root="scratch", quota=1000, job_bytes=500, wait_timeout=1)
+
+        # The working directory changes while the job runs; the reservation is still found and released
+        with scratch.workspace() as path:
+            os.chdir(tempfile.gettempdir())
+            scratch.wait_for_room(path)
+        self.assertEqual(scratch.holders, {})
+        self.assertEqual(os.listdir(os.path.join(root, "scratch")), ["reservations.lock"])
+
+
+if __name__ == "__main__":
+    unittest.main()